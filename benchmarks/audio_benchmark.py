@@ -0,0 +1,47 @@
+"""Times WAV encoding in summary.audio for growing clip lengths.
+
+The encoding time per second of audio should stay flat, i.e. the cost is
+linear in the clip length. The previous per-sample implementation is timed
+on the shorter clips for comparison.
+
+Usage: python -m benchmarks.audio_benchmark
+"""
+from __future__ import print_function
+
+import struct
+import time
+
+import numpy as np
+
+from tensorboardX.summary import audio
+
+SAMPLE_RATE = 44100
+SECONDS = [1, 2, 5, 10, 30, 60]
+LEGACY_MAX_SECONDS = 5
+
+
+def legacy_encode(tensor):
+    tensor_list = [int(32767.0 * x) for x in tensor]
+    tensor_enc = b''
+    for v in tensor_list:
+        tensor_enc += struct.pack('<h', v)
+    return tensor_enc
+
+
+def timed(fn, *args):
+    start = time.time()
+    fn(*args)
+    return time.time() - start
+
+
+def main():
+    print('{:>8} {:>14} {:>14} {:>18}'.format('seconds', 'audio (s)', 'per second', 'legacy frames (s)'))
+    for seconds in SECONDS:
+        clip = np.random.uniform(-1, 1, SAMPLE_RATE * seconds).astype(np.float32)
+        elapsed = timed(audio, 'clip', clip, SAMPLE_RATE)
+        legacy = timed(legacy_encode, clip) if seconds <= LEGACY_MAX_SECONDS else float('nan')
+        print('{:>8} {:>14.4f} {:>14.6f} {:>18.3f}'.format(seconds, elapsed, elapsed / seconds, legacy))
+
+
+if __name__ == '__main__':
+    main()
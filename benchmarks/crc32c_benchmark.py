@@ -0,0 +1,39 @@
+"""Compares the throughput of the available CRC-32C backends.
+
+Usage: python -m benchmarks.crc32c_benchmark
+"""
+from __future__ import print_function
+
+import os
+import timeit
+
+from tensorboardX import crc32c
+
+SIZES = [16, 1024, 64 * 1024, 1024 * 1024]
+
+
+def bench(size, repeat=5):
+    data = os.urandom(size)
+    number = max(1, (1 << 20) // size)
+    if crc32c.get_backend() == 'python':
+        number = max(1, number // 64)
+    best = min(timeit.repeat(lambda: crc32c.crc32c(data), number=number, repeat=repeat))
+    return best / number
+
+
+def main():
+    default = crc32c.get_backend()
+    print('default backend: {}'.format(default))
+    print('{:>15}'.format('size') + ''.join('{:>15}'.format(b) for b in crc32c.available_backends()))
+    for size in SIZES:
+        row = '{:>15}'.format(size)
+        for backend in crc32c.available_backends():
+            crc32c.set_backend(backend)
+            seconds = bench(size)
+            row += '{:>10.1f} MB/s'.format(size / seconds / 1e6)
+        print(row)
+    crc32c.set_backend(default)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Compares make_histogram with the previous implementation.
+
+Reports the time and the peak memory allocated while building the histogram
+of float32 tensors with the default 'tensorflow' buckets, passed either as
+explicit edges or through the ``bins='tensorflow'`` fast path.
+
+Usage: python -m benchmarks.histogram_benchmark
+"""
+from __future__ import print_function
+
+import time
+import tracemalloc
+
+import numpy as np
+
+from tensorboardX.proto.summary_pb2 import HistogramProto
+from tensorboardX.summary import make_histogram
+
+SIZES = [10 ** 5, 10 ** 6, 10 ** 7]
+
+
+def default_bins():
+    v = 1E-12
+    buckets = []
+    neg_buckets = []
+    while v < 1E20:
+        buckets.append(v)
+        neg_buckets.append(-v)
+        v *= 1.1
+    return neg_buckets[::-1] + [0] + buckets
+
+
+def legacy_make_histogram(values, bins):
+    values = values.astype(float).reshape(-1)
+    counts, limits = np.histogram(values, bins=bins)
+    limits = limits[1:]
+    for i, c in enumerate(counts):
+        if c > 0:
+            start = max(0, i - 1)
+            break
+    for i, c in enumerate(reversed(counts)):
+        if c > 0:
+            end = counts.size - i
+            break
+    counts = counts[start:end]
+    limits = limits[start:end]
+    sum_sq = values.dot(values)
+    return HistogramProto(min=values.min(), max=values.max(), num=len(values), sum=values.sum(),
+                          sum_squares=sum_sq, bucket_limit=limits.tolist(), bucket=counts.tolist())
+
+
+def bench(fn, values, bins):
+    tracemalloc.start()
+    start = time.time()
+    fn(values, bins)
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    bins = default_bins()
+    print('{:>10} {:>24} {:>24} {:>24}'.format('size', 'legacy (s / peak MB)', 'explicit edges', "'tensorflow'"))
+    for size in SIZES:
+        values = np.random.randn(size).astype(np.float32)
+        row = '{:>10}'.format(size)
+        for fn, fn_bins in [(legacy_make_histogram, bins), (make_histogram, bins), (make_histogram, 'tensorflow')]:
+            elapsed, peak = bench(fn, values, fn_bins)
+            row += ' {:>14.3f} / {:>7.1f}'.format(elapsed, peak / 1e6)
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Measures image preparation for a 256x3x224x224 batch.
+
+Compares the previous pipeline (float64 canvas filled tile by tile, grayscale
+copied to three channels, uint8 converted to float32 and back) with
+x2num.make_np(x, 'IMG') followed by the uint8 conversion done in
+summary.image. PNG encoding is the same for both and is left out.
+
+Usage: python -m benchmarks.image_benchmark
+"""
+from __future__ import print_function
+
+import time
+import tracemalloc
+
+import numpy as np
+
+from tensorboardX.summary import _scale_to_uint8
+from tensorboardX.x2num import make_np
+
+BATCH = (256, 3, 224, 224)
+
+
+def legacy_make_grid(I, ncols=8):
+    nimg = I.shape[0]
+    H = I.shape[2]
+    W = I.shape[3]
+    ncols = min(nimg, ncols)
+    nrows = int(np.ceil(float(nimg) / ncols))
+    canvas = np.zeros((3, H * nrows, W * ncols))
+    i = 0
+    for y in range(nrows):
+        for x in range(ncols):
+            if i >= nimg:
+                break
+            canvas[:, y * H:(y + 1) * H, x * W:(x + 1) * W] = I[i]
+            i = i + 1
+    return canvas
+
+
+def legacy_prepare(I):
+    if I.dtype == np.uint8:
+        I = I.astype(np.float32) / 255.0
+    if I.shape[1] == 1:
+        I = np.concatenate((I, I, I), 1)
+    I = legacy_make_grid(I).transpose(1, 2, 0)
+    return (I.astype(np.float32) * 255).astype(np.uint8)
+
+
+def prepare(I):
+    I = make_np(I, 'IMG')
+    if I.dtype != np.uint8:
+        I = _scale_to_uint8(I, 255)
+    return I
+
+
+def bench(fn, batch):
+    tracemalloc.start()
+    start = time.time()
+    fn(batch)
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    batches = [
+        ('float32 RGB', np.random.rand(*BATCH).astype(np.float32)),
+        ('uint8 RGB', np.random.randint(0, 256, size=BATCH, dtype=np.uint8)),
+        ('uint8 gray', np.random.randint(0, 256, size=(BATCH[0], 1) + BATCH[2:], dtype=np.uint8)),
+    ]
+    print('{:>12} {:>24} {:>24}'.format('input', 'legacy (s / peak MB)', 'make_np (s / peak MB)'))
+    for name, batch in batches:
+        row = '{:>12}'.format(name)
+        for fn in [legacy_prepare, prepare]:
+            elapsed, peak = bench(fn, batch)
+            row += ' {:>14.3f} / {:>7.1f}'.format(elapsed, peak / 1e6)
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
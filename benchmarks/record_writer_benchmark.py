@@ -0,0 +1,98 @@
+"""Measures how many scalar events per second RecordWriter can write.
+
+Compares the buffered RecordWriter with the previous behaviour of four
+``write`` calls and a flush for every record. Both write through a file
+which counts the writes reaching the operating system. The CRCs, which both
+compute the same way, take most of the time, so each writer is also run with
+them replaced by a constant to isolate the cost of framing and system calls.
+
+Usage: python -m benchmarks.record_writer_benchmark
+"""
+from __future__ import print_function
+
+import io
+import os
+import shutil
+import struct
+import tempfile
+import time
+
+from tensorboardX import record_writer
+from tensorboardX.proto.event_pb2 import Event
+from tensorboardX.record_writer import RecordWriter, register_writer_factory
+from tensorboardX.summary import scalar
+
+NUM_EVENTS = 20000
+
+
+class CountingFileIO(io.FileIO):
+    """Unbuffered file counting its writes, each of which is a system call."""
+    writes = 0
+
+    def write(self, data):
+        CountingFileIO.writes += 1
+        return io.FileIO.write(self, data)
+
+
+class CountingWriterFactory(object):
+    """Opens ``bench://<path>`` as a buffered file over `CountingFileIO`."""
+
+    def open(self, path):
+        return io.BufferedWriter(CountingFileIO(path[len('bench://'):], 'w'))
+
+    def directory_check(self, path):
+        pass
+
+
+class UnbufferedRecordWriter(object):
+    def __init__(self, path):
+        self._writer = CountingWriterFactory().open(path)
+
+    def write(self, event_str):
+        w = self._writer.write
+        header = struct.pack('Q', len(event_str))
+        w(header)
+        w(struct.pack('I', record_writer.masked_crc32c(header)))
+        w(event_str)
+        w(struct.pack('I', record_writer.masked_crc32c(event_str)))
+        self._writer.flush()
+
+    def close(self):
+        self._writer.close()
+
+
+def bench(writer_cls, logdir, crc):
+    events = [Event(wall_time=time.time(), step=i, summary=scalar('loss', float(i))).SerializeToString()
+              for i in range(NUM_EVENTS)]
+    masked_crc32c = record_writer.masked_crc32c
+    if not crc:
+        record_writer.masked_crc32c = lambda data: 0
+    CountingFileIO.writes = 0
+    try:
+        writer = writer_cls('bench://' + os.path.join(logdir, writer_cls.__name__))
+        start = time.time()
+        for event_str in events:
+            writer.write(event_str)
+        writer.close()
+        elapsed = time.time() - start
+    finally:
+        record_writer.masked_crc32c = masked_crc32c
+    return NUM_EVENTS / elapsed, CountingFileIO.writes
+
+
+def main():
+    register_writer_factory('bench', CountingWriterFactory())
+    logdir = tempfile.mkdtemp()
+    try:
+        print('{:>25} {:>5} {:>12} {:>8}'.format('', 'crc', 'events/s', 'writes'))
+        for crc in [True, False]:
+            for writer_cls in [UnbufferedRecordWriter, RecordWriter]:
+                rate, writes = bench(writer_cls, logdir, crc)
+                name = writer_cls.__name__
+                print('{:>25} {:>5} {:>12.0f} {:>8}'.format(name, 'on' if crc else 'off', rate, writes))
+    finally:
+        shutil.rmtree(logdir)
+
+
+if __name__ == '__main__':
+    main()
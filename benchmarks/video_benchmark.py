@@ -0,0 +1,80 @@
+"""Measures the tiling of a batch of videos done before GIF encoding.
+
+Compares the previous _prepare_video (power-of-two padding with float64
+zeros, uint8 converted to float32) followed by the uint8 conversion of
+summary.video with the current _prepare_video and uint8 conversion. GIF
+encoding is the same for both and is left out.
+
+Usage: python -m benchmarks.video_benchmark
+"""
+from __future__ import print_function
+
+import time
+import tracemalloc
+
+import numpy as np
+
+from tensorboardX.summary import _scale_to_uint8
+from tensorboardX.x2num import _prepare_video
+
+SHAPES = [(16, 3, 64, 128, 128), (12, 3, 64, 128, 128)]
+
+
+def legacy_prepare_video(V):
+    b, c, t, h, w = V.shape
+
+    if V.dtype == np.uint8:
+        V = np.float32(V) / 255.
+
+    def is_power2(num):
+        return num != 0 and ((num & (num - 1)) == 0)
+
+    if not is_power2(V.shape[0]):
+        len_addition = int(2**V.shape[0].bit_length() - V.shape[0])
+        V = np.concatenate((V, np.zeros(shape=(len_addition, c, t, h, w))), axis=0)
+
+    b = V.shape[0]
+    n_rows = 2**((b.bit_length() - 1) // 2)
+    n_cols = b // n_rows
+
+    V = np.reshape(V, newshape=(n_rows, n_cols, c, t, h, w))
+    V = np.transpose(V, axes=(3, 0, 4, 1, 5, 2))
+    V = np.reshape(V, newshape=(t, n_rows * h, n_cols * w, c))
+    return (V.astype(np.float32) * 255).astype(np.uint8)
+
+
+def prepare_video(V):
+    V = _prepare_video(V)
+    if V.dtype != np.uint8:
+        V = _scale_to_uint8(V, 255)
+    return V
+
+
+def bench(fn, batch):
+    tracemalloc.start()
+    start = time.time()
+    fn(batch)
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    print('{:>28} {:>24} {:>24}'.format('input', 'legacy (s / peak MB)', '_prepare_video'))
+    for shape in SHAPES:
+        for dtype in [np.float32, np.uint8]:
+            if dtype == np.uint8:
+                batch = np.random.randint(0, 256, size=shape, dtype=np.uint8)
+            else:
+                batch = np.random.rand(*shape).astype(dtype)
+            row = '{:>28}'.format('{} {}'.format('x'.join(map(str, shape)), np.dtype(dtype).name))
+            for fn in [legacy_prepare_video, prepare_video]:
+                elapsed, peak = bench(fn, batch)
+                row += ' {:>14.3f} / {:>7.1f}'.format(elapsed, peak / 1e6)
+            print(row)
+            del batch
+
+
+if __name__ == '__main__':
+    main()
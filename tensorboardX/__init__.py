@@ -2,5 +2,6 @@
 """
 
 from .record_writer import RecordWriter
+from .summary import HistogramAccumulator
 from .torchvis import TorchVis
 from .writer import FileWriter, SummaryWriter
@@ -0,0 +1,131 @@
+"""Non-blocking device-to-host copies of tensors logged from the training loop.
+
+Converting a GPU tensor with ``x.cpu().numpy()`` waits for the device. With
+``SummaryWriter(async_transfer=True)`` the writer instead starts a non-blocking
+copy into a reused pinned host buffer and hands the resulting
+`PendingTransfer` to the summary encoder, whose threads wait for the copy and
+encode the summary.
+
+Other tensor types can take part by registering a function with
+`register_transfer`.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import threading
+
+from .x2num import make_np
+
+
+class PendingTransfer(object):
+    """A device-to-host copy which may still be running.
+
+    Args:
+      host: The host buffer the copy writes to, anything `make_np` converts.
+      event: Signals the end of the copy with ``query()`` (non-blocking, True
+        once done) and ``synchronize()`` (waits), like ``torch.cuda.Event``.
+      release: Called without arguments once the host buffer is not needed
+        anymore, e.g. to give it back to a `StagingBuffers` pool.
+    """
+
+    def __init__(self, host, event, release=None):
+        self._host = host
+        self._event = event
+        self._release = release
+
+    def done(self):
+        """Returns True if the copy has finished."""
+        return self._event.query()
+
+    def wait(self):
+        """Waits for the copy and returns the host buffer as a numpy array.
+
+        The array is only valid until `release` is called.
+        """
+        self._event.synchronize()
+        return make_np(self._host)
+
+    def release(self):
+        """Gives the host buffer back. Safe to call more than once."""
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+class StagingBuffers(object):
+    """Free host buffers kept for reuse, keyed by shape and dtype."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._free = collections.defaultdict(list)
+        self.allocated = 0
+
+    def acquire(self, key, allocate):
+        """Returns a free buffer for ``key``, or a new one made by ``allocate()``."""
+        with self._lock:
+            if self._free[key]:
+                return self._free[key].pop()
+            self.allocated += 1
+        return allocate()
+
+    def release(self, key, buffer):
+        with self._lock:
+            self._free[key].append(buffer)
+
+
+def register_transfer(cls, fn):
+    """Registers ``fn(x, staging)`` to start the transfer of instances of ``cls``.
+
+    ``fn`` returns a `PendingTransfer`, or None when ``x`` is already on the
+    host and can be converted synchronously. ``staging`` is the writer's
+    `StagingBuffers`.
+    """
+    _transfers[cls] = fn
+    _dispatch_cache.clear()
+
+
+def start_transfer(x, staging):
+    """Starts copying ``x`` to the host.
+
+    Returns:
+      A `PendingTransfer`, or None if ``x`` needs no device-to-host copy.
+    """
+    fn = _dispatch_cache.get(type(x))
+    if fn is None:
+        fn = _find_transfer(type(x))
+    return fn(x, staging)
+
+
+def _find_transfer(cls):
+    fn = _no_transfer
+    for base in cls.__mro__:
+        if base in _transfers:
+            fn = _transfers[base]
+            break
+    else:
+        if 'torch' in str(cls):
+            fn = _torch_transfer
+    _dispatch_cache[cls] = fn
+    return fn
+
+
+def _no_transfer(x, staging):
+    return None
+
+
+def _torch_transfer(x, staging):
+    import torch
+    if not isinstance(x, torch.Tensor) or not x.is_cuda:
+        return None
+    key = (tuple(x.shape), x.dtype)
+    host = staging.acquire(key, lambda: torch.empty(key[0], dtype=key[1], pin_memory=True))
+    host.copy_(x.detach(), non_blocking=True)
+    event = torch.cuda.Event()
+    event.record()
+    return PendingTransfer(host, event, lambda: staging.release(key, host))
+
+
+_transfers = {}
+_dispatch_cache = {}
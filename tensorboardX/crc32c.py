@@ -1,4 +1,42 @@
+"""CRC-32C (Castagnoli) checksum used to frame TFRecord event files.
+
+Several implementations are available and the fastest one present is picked
+at import time:
+
+* ``crc32c``: the compiled `crc32c <https://pypi.org/project/crc32c/>`_ wheel.
+* ``google_crc32c``: the compiled
+  `google-crc32c <https://pypi.org/project/google-crc32c/>`_ wheel.
+* ``numpy``: a vectorized slicing-by-8 implementation which checksums many
+  lanes of the buffer in parallel and combines them afterwards.
+* ``python``: a pure Python slicing-by-8 loop.
+
+Use :func:`get_backend` to see which one is active and :func:`set_backend` to
+pick another one.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
 import array
+import struct
+from collections import OrderedDict
+
+from six.moves import zip
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import crc32c as _crc32c_ext
+except ImportError:
+    _crc32c_ext = None
+
+try:
+    import google_crc32c as _google_crc32c_ext
+except ImportError:
+    _google_crc32c_ext = None
 
 
 CRC_TABLE = (
@@ -74,6 +112,179 @@ CRC_INIT = 0
 _MASK = 0xFFFFFFFF
 
 
+def _slicing_tables():
+    # tables[k][b] is the CRC register after byte b is followed by k zero bytes.
+    tables = [CRC_TABLE]
+    for k in range(1, 8):
+        prev = tables[-1]
+        tables.append(tuple((prev[i] >> 8) ^ CRC_TABLE[prev[i] & 0xff] for i in range(256)))
+    return tuple(tables)
+
+
+CRC_TABLES = _slicing_tables()
+
+# Shorter inputs (such as record headers) are faster with the byte loop.
+_PY_SLICING_MIN_SIZE = 32
+# Bytes unpacked at once by the slicing-by-8 loop, bounds the temporary tuple.
+_PY_CHUNK_SIZE = 1 << 16
+
+
+def _python_crc_update(crc, data):
+    if not isinstance(data, (bytes, bytearray)):
+        if type(data) != array.array or data.itemsize != 1:
+            data = array.array("B", data)
+        data = bytearray(data)
+
+    crc ^= _MASK
+    size = len(data)
+    if size < _PY_SLICING_MIN_SIZE:
+        for b in bytearray(data):
+            crc = CRC_TABLE[(crc ^ b) & 0xff] ^ (crc >> 8)
+        return crc ^ _MASK
+
+    t0, t1, t2, t3, t4, t5, t6, t7 = CRC_TABLES
+    end = size - size % 8
+    # Slicing-by-8: consume two little endian 32-bit words per iteration.
+    for start in range(0, end, _PY_CHUNK_SIZE):
+        stop = min(start + _PY_CHUNK_SIZE, end)
+        words = iter(struct.unpack('<%dI' % ((stop - start) // 4), data[start:stop]))
+        for lo, hi in zip(words, words):
+            lo ^= crc
+            crc = t7[lo & 0xff] ^ t6[(lo >> 8) & 0xff] ^ t5[(lo >> 16) & 0xff] ^ t4[lo >> 24]
+            crc ^= t3[hi & 0xff] ^ t2[(hi >> 8) & 0xff] ^ t1[(hi >> 16) & 0xff] ^ t0[hi >> 24]
+    for b in bytearray(data[end:]):
+        crc = t0[(crc ^ b) & 0xff] ^ (crc >> 8)
+    return crc ^ _MASK
+
+
+def _as_buffer(data):
+    # Compiled backends and numpy want the buffer protocol, the pure Python
+    # implementation also takes any iterable over bytes.
+    try:
+        return memoryview(data)
+    except TypeError:
+        return bytearray(data)
+
+
+# The numpy path splits the buffer into about this many lanes.
+_NP_LANES = 4096
+# Below this size the setup cost of the numpy path is not worth it.
+_NP_MIN_SIZE = 4096
+_np_slicing_tables = None
+# _np_shift_tables[k] appends 2 ** k zero bytes to a CRC register.
+_np_shift_tables = []
+
+
+def _np_apply(op, x):
+    # ``op`` is a linear operator on the 32-bit register stored as one
+    # 256-entry table per input byte.
+    return op[0][x & 0xff] ^ op[1][(x >> 8) & 0xff] ^ op[2][(x >> 16) & 0xff] ^ op[3][x >> 24]
+
+
+def _np_shift_table(k):
+    if not _np_shift_tables:
+        values = np.arange(256, dtype=np.uint32)
+        # One zero byte: reg -> CRC_TABLE[reg & 0xff] ^ (reg >> 8).
+        op = [np.asarray(CRC_TABLE, dtype=np.uint32)]
+        op.extend(values << (8 * (b - 1)) for b in range(1, 4))
+        _np_shift_tables.append(np.stack(op))
+    while len(_np_shift_tables) <= k:
+        op = _np_shift_tables[-1]
+        _np_shift_tables.append(np.stack([_np_apply(op, op[b]) for b in range(4)]))
+    return _np_shift_tables[k]
+
+
+def _numpy_crc_update(crc, data):
+    global _np_slicing_tables
+    if isinstance(data, bytes) and len(data) < _NP_MIN_SIZE:
+        return _python_crc_update(crc, data)
+    buf = np.frombuffer(_as_buffer(data), dtype=np.uint8)
+    if buf.size < _NP_MIN_SIZE:
+        return _python_crc_update(crc, buf.tobytes())
+    if _np_slicing_tables is None:
+        _np_slicing_tables = np.array(CRC_TABLES, dtype=np.uint32)
+    t0, t1, t2, t3, t4, t5, t6, t7 = _np_slicing_tables
+
+    # Checksum every lane independently, eight bytes per step. Only the first
+    # lane starts from the incoming CRC, the others start from zero.
+    lane_bits = max(3, (buf.size // _NP_LANES).bit_length() - 1)
+    lane_size = 1 << lane_bits
+    lanes = buf.size >> lane_bits
+    words = buf[:lanes * lane_size].view('<u4').reshape(lanes, lane_size // 4)
+    regs = np.zeros(lanes, dtype=np.uint32)
+    regs[0] = crc ^ _MASK
+    for j in range(0, lane_size // 4, 2):
+        lo = regs ^ words[:, j]
+        hi = words[:, j + 1]
+        regs = t7[lo & 0xff] ^ t6[(lo >> 8) & 0xff] ^ t5[(lo >> 16) & 0xff] ^ t4[lo >> 24]
+        regs ^= t3[hi & 0xff] ^ t2[(hi >> 8) & 0xff] ^ t1[(hi >> 16) & 0xff] ^ t0[hi >> 24]
+
+    # CRC is linear, so crc(A + B) = shift(crc(A), len(B)) ^ crc(B). Combine
+    # neighbouring lanes pairwise; leading zero lanes do not change the result.
+    padded = 1 << (lanes - 1).bit_length()
+    if padded != lanes:
+        regs = np.concatenate((np.zeros(padded - lanes, dtype=np.uint32), regs))
+    while regs.size > 1:
+        pairs = regs.reshape(-1, 2)
+        regs = _np_apply(_np_shift_table(lane_bits), pairs[:, 0]) ^ pairs[:, 1]
+        lane_bits += 1
+
+    crc = int(regs[0]) ^ _MASK
+    return _python_crc_update(crc, buf[lanes * lane_size:].tobytes())
+
+
+def _crc32c_ext_update(crc, data):
+    return _crc32c_ext.crc32c(_as_buffer(data), crc)
+
+
+def _google_crc32c_ext_update(crc, data):
+    if not isinstance(data, bytes):
+        data = bytes(bytearray(data))
+    return _google_crc32c_ext.extend(crc, data)
+
+
+def _available_backends():
+    backends = OrderedDict()
+    if _crc32c_ext is not None:
+        backends['crc32c'] = _crc32c_ext_update
+    # google-crc32c silently falls back to pure Python without its C library.
+    if _google_crc32c_ext is not None and getattr(_google_crc32c_ext, 'implementation', None) == 'c':
+        backends['google_crc32c'] = _google_crc32c_ext_update
+    if np is not None:
+        backends['numpy'] = _numpy_crc_update
+    backends['python'] = _python_crc_update
+    return backends
+
+
+_BACKENDS = _available_backends()
+_backend = next(iter(_BACKENDS))
+_backend_update = _BACKENDS[_backend]
+
+
+def available_backends():
+    """Returns the names of the usable CRC-32C backends, fastest first."""
+    return list(_BACKENDS)
+
+
+def get_backend():
+    """Returns the name of the active CRC-32C backend."""
+    return _backend
+
+
+def set_backend(name):
+    """Selects the CRC-32C backend used by :func:`crc_update`.
+
+    Args:
+      name: one of :func:`available_backends`.
+    """
+    global _backend, _backend_update
+    if name not in _BACKENDS:
+        raise ValueError('CRC-32C backend {} is not available, choose one of {}'.format(
+            name, available_backends()))
+    _backend = name
+    _backend_update = _BACKENDS[name]
+
+
 def crc_update(crc, data):
     """Update CRC-32C checksum with data.
 
@@ -84,17 +295,7 @@ def crc_update(crc, data):
     Returns:
       32-bit updated CRC-32C as long.
     """
-
-    if type(data) != array.array or data.itemsize != 1:
-        buf = array.array("B", data)
-    else:
-        buf = data
-
-    crc ^= _MASK
-    for b in buf:
-        table_index = (crc ^ b) & 0xff
-        crc = (CRC_TABLE[table_index] ^ (crc >> 8)) & _MASK
-    return crc ^ _MASK
+    return _backend_update(crc, data)
 
 
 def crc_finalize(crc):
@@ -18,42 +18,124 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import atexit
+import collections
 import logging
 import os.path
 import socket
 import threading
 import time
+import weakref
 
 import six
 
 from .proto import event_pb2
-from .record_writer import RecordWriter, directory_check
+from .proto import summary_pb2
+from .record_writer import RecordWriter, directory_check, supports_append
+
+logger = logging.getLogger(__name__)
+
+# What `EventFileWriter.add_event` does when the queue of pending events is full.
+OVERFLOW_POLICIES = ('block', 'drop_newest', 'drop_oldest', 'coalesce')
+
+# Tag of the scalar which records the number of events dropped so far.
+DROPPED_EVENTS_TAG = 'tensorboardX/dropped_events'
+
+# Bytes added to each event by the record framing, see `RecordWriter`.
+_RECORD_OVERHEAD = 16
+
+# Writers not closed yet. The logger threads are daemons, so these are closed
+# at interpreter exit to write the events still pending.
+_live_writers = weakref.WeakSet()
+
+
+def _close_live_writers():
+    for writer in list(_live_writers):
+        try:
+            writer.close()
+        except Exception:
+            logger.exception('Closing an event writer at exit failed.')
+
+
+atexit.register(_close_live_writers)
+
+_file_timestamp_lock = threading.Lock()
+# The last timestamp given to each file prefix, while it is not in the past.
+_last_file_timestamps = {}
+
+
+def _file_timestamp(file_prefix):
+    """Returns the timestamp of a new event file name: the current time in
+    seconds, but later than the previous one of the same ``file_prefix`` so
+    that the names of its files never collide."""
+    now = int(time.time())
+    with _file_timestamp_lock:
+        for prefix in [prefix for prefix, last in _last_file_timestamps.items() if last < now]:
+            del _last_file_timestamps[prefix]
+        timestamp = max(now, _last_file_timestamps.get(file_prefix, 0) + 1)
+        _last_file_timestamps[file_prefix] = timestamp
+        return timestamp
 
 
 class EventsWriter(object):
     '''Writes `Event` protocol buffers to an event file.'''
 
-    def __init__(self, file_prefix, filename_suffix=''):
+    def __init__(self, file_prefix, filename_suffix='', flush_secs=120, max_file_bytes=None, max_file_secs=None):
         '''
         Events files have a name of the form
         '/some/file/path/events.out.tfevents.[timestamp].[hostname]'
-        '''
-        self._file_name = file_prefix + ".out.tfevents." + str(time.time())[:10] + "." +\
-            socket.gethostname() + filename_suffix
-
-        # Open(Create) the log file with the particular form of name.
-        logging.basicConfig(filename=self._file_name)
 
+        With ``max_file_bytes`` or ``max_file_secs``, the events go to a new
+        event file once the current one holds that many bytes or was opened
+        that many seconds ago. Each file starts with a `file_version` event
+        carrying the last step written so far, and is not written to anymore
+        once the next one is opened.
+        '''
+        self._file_prefix = file_prefix
+        self._filename_suffix = filename_suffix
+        self._flush_secs = flush_secs
+        self._max_file_bytes = max_file_bytes
+        self._max_file_secs = max_file_secs
         self._num_outstanding_events = 0
+        self._last_step = 0
+        self._open_file()
 
-        self._py_recordio_writer = RecordWriter(self._file_name)
+    def _open_file(self):
+        self._file_name = self._file_prefix + ".out.tfevents." + str(_file_timestamp(self._file_prefix)) + "." +\
+            socket.gethostname() + self._filename_suffix
+        self._py_recordio_writer = RecordWriter(self._file_name, self._flush_secs)
+        self._file_bytes = 0
+        self._file_events = 0
+        self._file_opened = time.time()
 
         # Initialize an event instance.
-        self._event = event_pb2.Event()
+        self._event = event_pb2.Event(step=self._last_step, file_version='brain.Event:2')
 
         self._event.wall_time = time.time()
 
-        self.write_event(self._event)
+        self._py_recordio_writer.write(self._record(self._event.SerializeToString()))
+
+    def _record(self, event_str):
+        self._file_bytes += len(event_str) + _RECORD_OVERHEAD
+        return event_str
+
+    def _maybe_rotate(self):
+        if not self._file_events:
+            return
+        full = self._max_file_bytes is not None and self._file_bytes >= self._max_file_bytes
+        old = self._max_file_secs is not None and time.time() - self._file_opened >= self._max_file_secs
+        if full or old:
+            self._py_recordio_writer.close()
+            self._open_file()
+
+    def reopen(self):
+        '''Opens the current event file again after `close`, to add events at
+        its end.'''
+        self._py_recordio_writer = RecordWriter(self._file_name, self._flush_secs, append=True)
+
+    def get_file_name(self):
+        '''Returns the name of the event file.'''
+        return self._file_name
 
     def write_event(self, event):
         '''Append "event" to the file.'''
@@ -62,15 +144,35 @@ class EventsWriter(object):
         if not isinstance(event, event_pb2.Event):
             raise TypeError("Expected an event_pb2.Event proto, "
                             " but got %s" % type(event))
+        self._maybe_rotate()
+        self._last_step = max(self._last_step, event.step)
         return self._write_serialized_event(event.SerializeToString())
 
+    def write_events(self, events):
+        '''Append all of "events" to the file with a single write.'''
+        for event in events:
+            if not isinstance(event, event_pb2.Event):
+                raise TypeError("Expected an event_pb2.Event proto, "
+                                " but got %s" % type(event))
+        self._maybe_rotate()
+        for event in events:
+            self._last_step = max(self._last_step, event.step)
+        return self._write_serialized_events([event.SerializeToString() for event in events])
+
     def _write_serialized_event(self, event_str):
         self._num_outstanding_events += 1
-        self._py_recordio_writer.write(event_str)
+        self._file_events += 1
+        self._py_recordio_writer.write(self._record(event_str))
+
+    def _write_serialized_events(self, event_strs):
+        self._num_outstanding_events += len(event_strs)
+        self._file_events += len(event_strs)
+        self._py_recordio_writer.write_batch([self._record(event_str) for event_str in event_strs])
 
     def flush(self):
         '''Flushes the event file to disk.'''
         self._num_outstanding_events = 0
+        self._py_recordio_writer.flush()
         return True
 
     def close(self):
@@ -91,7 +193,8 @@ class EventFileWriter(object):
     @@close
     """
 
-    def __init__(self, logdir, max_queue=10, flush_secs=120, filename_suffix=''):
+    def __init__(self, logdir, max_queue=10, flush_secs=120, filename_suffix='',
+                 overflow_policy='block', max_file_bytes=None, max_file_secs=None):
         """Creates a `EventFileWriter` and an event file to write to.
         On construction the summary writer creates a new event file in `logdir`.
         This event file will contain `Event` protocol buffers, which are written to
@@ -102,22 +205,46 @@ class EventFileWriter(object):
            and events to disk.
         *  `max_queue`: Maximum number of summaries or events pending to be
            written to disk before one of the 'add' calls block.
+        *  `overflow_policy`: What the 'add' calls do when `max_queue` events are
+           already pending:
+           - 'block': wait until there is room in the queue.
+           - 'drop_newest': drop the event being added.
+           - 'drop_oldest': drop the oldest pending event to make room.
+           - 'coalesce': replace the pending scalar with the same tag by the new
+             one; other events are dropped like 'drop_newest'.
+           The number of dropped events is logged as the scalar
+           'tensorboardX/dropped_events'.
+        *  `max_file_bytes`, `max_file_secs`: Rotate to a new event file once
+           the current one is that large or that old, see `EventsWriter`.
         Args:
           logdir: A string. Directory where event file will be written.
           max_queue: Integer. Size of the queue for pending events and summaries.
           flush_secs: Number. How often, in seconds, to flush the
             pending events and summaries to disk.
+          overflow_policy: A string, one of `OVERFLOW_POLICIES`.
+          max_file_bytes: Integer. Size from which a new event file is started.
+          max_file_secs: Number. Age in seconds from which a new event file is
+            started.
         """
         self._logdir = logdir
         directory_check(self._logdir)
-        self._event_queue = six.moves.queue.Queue(max_queue)
-        self._ev_writer = EventsWriter(os.path.join(
-            self._logdir, "events"), filename_suffix)
+        self._event_queue = _EventQueue(max_queue, overflow_policy)
+        self._flush_secs = flush_secs
+        self._filename_suffix = filename_suffix
+        self._max_file_bytes = max_file_bytes
+        self._max_file_secs = max_file_secs
         self._closed = False
+        self._open()
+
+    def _open(self):
+        self._ev_writer = EventsWriter(os.path.join(
+            self._logdir, "events"), self._filename_suffix, self._flush_secs,
+            max_file_bytes=self._max_file_bytes, max_file_secs=self._max_file_secs)
         self._worker = _EventLoggerThread(self._event_queue, self._ev_writer,
-                                          flush_secs)
+                                          self._flush_secs)
 
         self._worker.start()
+        _live_writers.add(self)
 
     def get_logdir(self):
         """Returns the directory where event file will be written."""
@@ -130,6 +257,7 @@ class EventFileWriter(object):
         Does nothing if the EventFileWriter was not closed.
         """
         if self._closed:
+            self._open()
             self._closed = False
 
     def add_event(self, event):
@@ -138,23 +266,284 @@ class EventFileWriter(object):
           event: An `Event` protocol buffer.
         """
         if not self._closed:
-            self._event_queue.put(event)
+            self._event_queue.put_event(event)
+
+    def get_stats(self):
+        """Returns counters about the background writes as a dict.
+        *  `batches`: Number of batches written by the logger thread.
+        *  `events`: Number of events written by the logger thread.
+        *  `last_batch_size`: Number of events in the most recent batch.
+        *  `max_batch_size`: Largest number of events written in one batch.
+        *  `dropped`: Number of events dropped by the overflow policy.
+        """
+        stats = dict(self._worker.stats)
+        stats['dropped'] = self._event_queue.dropped
+        return stats
 
     def flush(self):
         """Flushes the event file to disk.
         Call this method to make sure that all pending events have been written to
         disk.
         """
-        self._event_queue.join()
+        self._event_queue.join_while_alive(self._worker)
         self._ev_writer.flush()
 
     def close(self):
         """Flushes the event file to disk and close the file.
         Call this method when you do not need the summary writer anymore.
         """
+        if self._closed:
+            return
         self.flush()
+        self._worker.stop()
         self._ev_writer.close()
         self._closed = True
+        _live_writers.discard(self)
+
+
+class MultiplexedEventFileWriter(object):
+    """Writes the events of many runs, each in its own directory, with a
+    single queue and logger thread.
+
+    Every run gets the event file an `EventFileWriter` would create in its
+    directory, but the files are only opened when an event is written to
+    them, at most `max_open_files` local files are kept open (the least
+    recently written is closed first) and files which received no event in
+    `idle_secs` seconds are closed. A closed file is reopened in append mode
+    when its run is written to again. Files which cannot be appended to (e.g.
+    on S3, see `record_writer.supports_append`) stay open until `close`.
+    """
+
+    def __init__(self, max_queue=1024, flush_secs=120, filename_suffix='', overflow_policy='block',
+                 max_open_files=32, idle_secs=600, max_file_bytes=None, max_file_secs=None):
+        """
+        Args:
+          max_queue: Integer. Size of the queue shared by all the runs.
+          flush_secs: Number. How often, in seconds, to flush the open files.
+          filename_suffix: A string. Suffix of the event file names.
+          overflow_policy: A string, one of `OVERFLOW_POLICIES`.
+          max_open_files: Integer. Number of local files kept open.
+          idle_secs: Number. Files not written for this long are closed at
+            the next flush.
+          max_file_bytes: Integer. Size from which a run starts a new event
+            file, see `EventsWriter`.
+          max_file_secs: Number. Age in seconds from which a run starts a new
+            event file.
+        """
+        self._event_queue = _RoutedEventQueue(max_queue, overflow_policy)
+        self._flush_secs = flush_secs
+        self._writers = _EventsWriterPool(filename_suffix, flush_secs, max_open_files, idle_secs, max_file_bytes,
+                                          max_file_secs)
+        self._closed = False
+        self._open()
+
+    def _open(self):
+        self._worker = _MultiplexedLoggerThread(self._event_queue, self._writers, self._flush_secs)
+        self._worker.start()
+        _live_writers.add(self)
+
+    def reopen(self):
+        """Starts the logger thread again after `close()`. Later events of a run
+        are appended to its event file."""
+        if self._closed:
+            self._open()
+            self._closed = False
+
+    def writer(self, logdir):
+        """Returns an object whose ``add_event(event)`` adds an event to the run in ``logdir``."""
+        return _RunEventWriter(self, logdir)
+
+    def add_event(self, logdir, event):
+        """Adds an event to the event file of the run in ``logdir``."""
+        if not self._closed:
+            self._event_queue.put_event((logdir, event))
+
+    def get_stats(self):
+        """Returns the counters of `EventFileWriter.get_stats`, plus
+        *  `open_files`: Number of event files currently open.
+        *  `opens`: Number of times an event file was opened or reopened.
+        """
+        stats = dict(self._worker.stats)
+        stats['dropped'] = self._event_queue.dropped
+        stats['open_files'] = self._writers.num_open()
+        stats['opens'] = self._writers.opens
+        return stats
+
+    def flush(self):
+        """Writes the pending events and flushes the open event files."""
+        self._event_queue.join_while_alive(self._worker)
+        self._writers.flush()
+
+    def close(self):
+        """Writes the pending events, stops the logger thread and closes the files."""
+        if self._closed:
+            return
+        self.flush()
+        self._worker.stop()
+        self._writers.close()
+        self._closed = True
+        _live_writers.discard(self)
+
+
+class _RunEventWriter(object):
+    """The events writer of one run of a `MultiplexedEventFileWriter`."""
+
+    def __init__(self, multiplexer, logdir):
+        self._multiplexer = multiplexer
+        self._logdir = logdir
+
+    def get_logdir(self):
+        return self._logdir
+
+    def add_event(self, event):
+        self._multiplexer.add_event(self._logdir, event)
+
+
+class _EventsWriterPool(object):
+    """`EventsWriter`s by run directory, with a bounded number of open files.
+
+    Only used from the logger thread, apart from `flush` and `close` which are
+    called once the queue is drained.
+    """
+
+    def __init__(self, filename_suffix, flush_secs, max_open_files, idle_secs, max_file_bytes=None,
+                 max_file_secs=None):
+        self._filename_suffix = filename_suffix
+        self._flush_secs = flush_secs
+        self._max_file_bytes = max_file_bytes
+        self._max_file_secs = max_file_secs
+        self._max_open_files = max_open_files
+        self._idle_secs = idle_secs
+        self._lock = threading.Lock()
+        # logdir -> (EventsWriter, time of the last write), least recently used first
+        self._open = collections.OrderedDict()
+        # logdir -> EventsWriter whose file was closed, to be reopened
+        self._closed = {}
+        self.opens = 0
+
+    def num_open(self):
+        return len(self._open)
+
+    def write_events(self, logdir, events):
+        with self._lock:
+            writer = self._get(logdir)
+            self._open[logdir] = (writer, time.time())
+        writer.write_events(events)
+
+    def _get(self, logdir):
+        if logdir in self._open:
+            return self._open.pop(logdir)[0]
+        closable = [d for d, (writer, _) in self._open.items() if supports_append(writer.get_file_name())]
+        if len(self._open) >= self._max_open_files and closable:
+            self._close(closable[0])
+        writer = self._closed.pop(logdir, None)
+        if writer is None:
+            directory_check(logdir)
+            writer = EventsWriter(os.path.join(logdir, "events"), self._filename_suffix, self._flush_secs,
+                                  self._max_file_bytes, self._max_file_secs)
+        else:
+            writer.reopen()
+        self.opens += 1
+        return writer
+
+    def close_idle(self, now):
+        """Closes the local files not written to in the last `idle_secs` seconds."""
+        with self._lock:
+            for logdir, (writer, last_write) in list(self._open.items()):
+                if now - last_write > self._idle_secs and supports_append(writer.get_file_name()):
+                    self._close(logdir)
+
+    def _close(self, logdir):
+        writer = self._open.pop(logdir)[0]
+        writer.close()
+        self._closed[logdir] = writer
+
+    def flush(self):
+        with self._lock:
+            for writer, _ in self._open.values():
+                writer.flush()
+
+    def close(self):
+        with self._lock:
+            for logdir in list(self._open):
+                self._close(logdir)
+
+
+def _scalar_tag(event):
+    """Returns the tag of an event holding a single scalar, otherwise None."""
+    if not event.HasField('summary') or len(event.summary.value) != 1:
+        return None
+    value = event.summary.value[0]
+    if value.WhichOneof('value') != 'simple_value':
+        return None
+    return value.tag
+
+
+class _EventQueue(six.moves.queue.Queue):
+    """Queue of pending events which applies an overflow policy when full."""
+
+    def __init__(self, maxsize, overflow_policy='block'):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError('overflow_policy should be one of {}, got {}'.format(
+                OVERFLOW_POLICIES, overflow_policy))
+        six.moves.queue.Queue.__init__(self, maxsize)
+        self.overflow_policy = overflow_policy
+        self.dropped = 0
+
+    def put_event(self, event):
+        """Adds an event, applying the overflow policy if the queue is full."""
+        if self.overflow_policy == 'block':
+            self.put(event)
+            return
+        with self.not_full:
+            if self.maxsize <= 0 or self._qsize() < self.maxsize:
+                self._put(event)
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+                return
+            self.dropped += 1
+            if self.overflow_policy == 'drop_oldest' and isinstance(self._event(self.queue[0]), event_pb2.Event):
+                # The dropped event will never be processed, the new one takes
+                # over its unfinished task.
+                self.queue.popleft()
+                self._put(event)
+                self.not_empty.notify()
+            elif self.overflow_policy == 'coalesce':
+                tag = _scalar_tag(self._event(event))
+                if tag is None:
+                    return
+                for i in range(len(self.queue) - 1, -1, -1):
+                    pending = self._event(self.queue[i])
+                    if not isinstance(pending, event_pb2.Event) or not self._same_run(self.queue[i], event):
+                        continue
+                    if _scalar_tag(pending) == tag:
+                        self.queue[i] = event
+                        return
+
+    def join_while_alive(self, thread, poll_secs=1.0):
+        """Like `join`, but returns early if ``thread``, the consumer of the
+        queue, is not running anymore and so will never process the items left."""
+        with self.all_tasks_done:
+            while self.unfinished_tasks and thread.is_alive():
+                self.all_tasks_done.wait(poll_secs)
+
+    def _event(self, item):
+        """Returns the `Event` of a queued item."""
+        return item
+
+    def _same_run(self, item, other):
+        """Returns True if the two queued items go to the same event file."""
+        return True
+
+
+class _RoutedEventQueue(_EventQueue):
+    """Queue of (logdir, event) pairs."""
+
+    def _event(self, item):
+        return item[1] if isinstance(item, tuple) else item
+
+    def _same_run(self, item, other):
+        return item[0] == other[0]
 
 
 class _EventLoggerThread(threading.Thread):
@@ -176,17 +565,115 @@ class _EventLoggerThread(threading.Thread):
         self._flush_secs = flush_secs
         # The first event will be flushed immediately.
         self._next_event_flush_time = 0
+        self._shutdown_signal = object()
+        self.stats = {'batches': 0, 'events': 0, 'last_batch_size': 0, 'max_batch_size': 0}
+        self._last_step = 0
+        self._logged_dropped = 0
+
+    def stop(self):
+        """Waits for the queued events to be written and stops the thread."""
+        if not self.is_alive():
+            return
+        self._queue.put(self._shutdown_signal)
+        self.join()
 
     def run(self):
         while True:
-            event = self._queue.get()
+            # Wake up when the next flush is due even if no event comes in,
+            # so that written events do not linger in the record buffer.
+            timeout = self._next_event_flush_time - time.time()
+            try:
+                if timeout > 0:
+                    events = [self._queue.get(True, timeout)]
+                else:
+                    events = [self._queue.get(False)]
+            except six.moves.queue.Empty:
+                events = []
+            # Drain whatever else is already queued so that a burst of events
+            # is serialized and written in one go.
+            while events and events[-1] is not self._shutdown_signal:
+                try:
+                    events.append(self._queue.get(False))
+                except six.moves.queue.Empty:
+                    break
+            batch = [event for event in events if event is not self._shutdown_signal]
+            stopping = len(batch) != len(events)
             try:
-                self._ev_writer.write_event(event)
-                # Flush the event writer every so often.
-                now = time.time()
-                if now > self._next_event_flush_time:
-                    self._ev_writer.flush()
-                    # Do it again in two minutes.
-                    self._next_event_flush_time = now + self._flush_secs
+                if batch:
+                    self._write_batch(batch)
+                    self._update_stats(len(batch))
+                if stopping:
+                    self._log_dropped_events()
+                else:
+                    # Flush the event writer every so often.
+                    now = time.time()
+                    if now > self._next_event_flush_time:
+                        # Do it again in two minutes, even if this flush fails.
+                        self._next_event_flush_time = now + self._flush_secs
+                        self._log_dropped_events()
+                        self._flush(now)
+            except Exception:
+                # Keep running, otherwise flush() and close() would wait forever
+                # for the events still queued.
+                logger.exception('Writing events failed.')
             finally:
-                self._queue.task_done()
+                for _ in events:
+                    self._queue.task_done()
+            if stopping:
+                return
+
+    def _write_batch(self, batch):
+        """Writes a batch of dequeued items."""
+        self._last_step = batch[-1].step
+        self._ev_writer.write_events(batch)
+
+    def _flush(self, now):
+        """Periodic flush of the event writer."""
+        self._ev_writer.flush()
+
+    def _log_dropped_events(self):
+        dropped = getattr(self._queue, 'dropped', 0)
+        if dropped == self._logged_dropped:
+            return
+        self._logged_dropped = dropped
+        summary = summary_pb2.Summary(value=[summary_pb2.Summary.Value(
+            tag=DROPPED_EVENTS_TAG, simple_value=dropped)])
+        self._write_dropped_event(event_pb2.Event(
+            wall_time=time.time(), step=self._last_step, summary=summary))
+
+    def _write_dropped_event(self, event):
+        self._ev_writer.write_events([event])
+
+    def _update_stats(self, batch_size):
+        stats = self.stats
+        stats['batches'] += 1
+        stats['events'] += batch_size
+        stats['last_batch_size'] = batch_size
+        stats['max_batch_size'] = max(stats['max_batch_size'], batch_size)
+
+
+class _MultiplexedLoggerThread(_EventLoggerThread):
+    """Logger thread of a `MultiplexedEventFileWriter`, its queue holds
+    (logdir, event) pairs and its event writer is an `_EventsWriterPool`."""
+
+    def __init__(self, queue, writers, flush_secs):
+        _EventLoggerThread.__init__(self, queue, writers, flush_secs)
+        self._last_logdir = None
+
+    def _write_batch(self, batch):
+        # One write per run, in the order the runs appear in the batch.
+        by_logdir = collections.OrderedDict()
+        for logdir, event in batch:
+            by_logdir.setdefault(logdir, []).append(event)
+        for logdir, events in by_logdir.items():
+            self._ev_writer.write_events(logdir, events)
+        self._last_logdir, last_event = batch[-1]
+        self._last_step = last_event.step
+
+    def _flush(self, now):
+        self._ev_writer.flush()
+        self._ev_writer.close_idle(now)
+
+    def _write_dropped_event(self, event):
+        if self._last_logdir is not None:
+            self._ev_writer.write_events(self._last_logdir, [event])
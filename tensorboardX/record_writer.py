@@ -3,15 +3,22 @@ To write tf_record into file. Here we use it for tensorboard's event writting.
 The code was borrowed from https://github.com/TeamHG-Memex/tensorboard_logger
 """
 
-import io
 import os.path
 import re
 import struct
+import threading
+import time
 try:
     import boto3
+    import botocore.config
     S3_ENABLED = True
 except ImportError:
     S3_ENABLED = False
+try:
+    from fsspec.core import url_to_fs
+    FSSPEC_ENABLED = True
+except ImportError:
+    FSSPEC_ENABLED = False
 
 from .crc32c import crc32c
 
@@ -21,8 +28,9 @@ _VALID_OP_NAME_PART = re.compile('[A-Za-z0-9_.\\-/]+')
 
 # Registry of writer factories by prefix backends.
 #
-# Currently supports "s3://" URLs for S3 based on boto and falls
-# back to local filesystem.
+# Currently supports "s3://" URLs for S3 based on boto, the URLs of
+# `FSSPEC_PREFIXES` when fsspec is installed, and falls back to local
+# filesystem.
 REGISTERED_FACTORIES = {}
 
 
@@ -43,51 +51,236 @@ def directory_check(path):
             os.makedirs(path)
 
 
-def open_file(path):
-    '''Open a writer for outputting event files.'''
+def open_file(path, append=False):
+    '''Open a writer for outputting event files.
+
+    With ``append``, writes go to the end of an existing file, which only
+    some backends allow, see `supports_append`.
+    '''
     try:
         prefix = path.split(':')[0]
         factory = REGISTERED_FACTORIES[prefix]
-        return factory.open(path)
     except KeyError:
-        return open(path, 'wb')
+        return open(path, 'ab' if append else 'wb')
+    if append:
+        if not supports_append(path):
+            raise ValueError('Cannot append to {}'.format(path))
+        return factory.open(path, append=True)
+    return factory.open(path)
+
+
+def supports_append(path):
+    '''Returns True if `open_file` can reopen ``path`` to append to it.'''
+    factory = REGISTERED_FACTORIES.get(path.split(':')[0])
+    if factory is None:
+        return True
+    return hasattr(factory, 'supports_append') and factory.supports_append(path)
+
+
+class S3ClientCache(object):
+    """S3 clients shared by all the S3 writers of the process.
+
+    Creating a client resolves credentials and sets up a new HTTP connection
+    pool, so one client is kept per endpoint, credentials and pool size. boto3
+    clients can be used from several threads at once.
+
+    The requests made by the writers are counted, see `get_stats`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._requests = {}
+        self._bytes_uploaded = 0
+
+    def get(self, endpoint_url=None, region_name=None, aws_access_key_id=None, aws_secret_access_key=None,
+            aws_session_token=None, max_pool_connections=10):
+        """Returns the client for these options, creating it on first use.
+
+        Options left to None are resolved by boto3 (environment, config
+        files, instance metadata).
+        """
+        key = (endpoint_url, region_name, aws_access_key_id, aws_secret_access_key, aws_session_token,
+               max_pool_connections)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                # Sessions are not thread-safe, each client gets its own.
+                client = boto3.session.Session().client(
+                    's3', endpoint_url=endpoint_url, region_name=region_name, aws_access_key_id=aws_access_key_id,
+                    aws_secret_access_key=aws_secret_access_key, aws_session_token=aws_session_token,
+                    config=botocore.config.Config(max_pool_connections=max_pool_connections))
+                self._clients[key] = client
+            return client
+
+    def record(self, operation, bytes_uploaded=0):
+        """Counts a request made with one of the clients."""
+        with self._lock:
+            self._requests[operation] = self._requests.get(operation, 0) + 1
+            self._bytes_uploaded += bytes_uploaded
+
+    def get_stats(self):
+        """Returns counters about the S3 writers as a dict.
+        *  `clients`: Number of clients created.
+        *  `requests`: Number of requests by operation name, e.g. `upload_part`.
+        *  `bytes_uploaded`: Number of bytes of event files sent.
+        """
+        with self._lock:
+            return {'clients': len(self._clients),
+                    'requests': dict(self._requests),
+                    'bytes_uploaded': self._bytes_uploaded}
+
+    def clear(self):
+        """Drops the clients and resets the counters."""
+        with self._lock:
+            self._clients.clear()
+            self._requests.clear()
+            self._bytes_uploaded = 0
+
+
+s3_clients = S3ClientCache()
+
+# S3 requires every part of a multipart upload but the last to be this large.
+S3_MIN_PART_SIZE = 5 << 20
 
 
 class S3RecordWriter(object):
-    """Writes tensorboard protocol buffer files to S3."""
-
-    def __init__(self, path):
+    """Writes tensorboard protocol buffer files to S3.
+
+    The file is sent as a multipart upload: whenever ``part_size`` bytes are
+    buffered they are uploaded as the next part, so at most one part (plus the
+    last write) is held in memory and no byte is sent twice. S3 only shows an
+    object once its upload is completed. An object smaller than one part is
+    sent with a single ``put_object`` instead.
+
+    So that a long run shows up in S3 before `close`, `flush` completes the
+    current object once it holds ``flush_bytes`` bytes and the following
+    writes go to a new object, named after the file followed by ``.000001``,
+    ``.000002``, ... Each object ends at a flush, hence at a record boundary,
+    and the names sort in the order TensorBoard has to read them in.
+    """
+
+    def __init__(self, path, part_size=S3_MIN_PART_SIZE, client_options=None, flush_bytes=S3_MIN_PART_SIZE):
+        """
+        Args:
+          path: A string. ``s3://bucket/key`` URL of the file.
+          part_size: Integer. Size of the uploaded parts in bytes.
+          client_options: A dict. Keyword arguments of `S3ClientCache.get`
+            selecting the shared client.
+          flush_bytes: Integer. Size from which `flush` completes the current
+            object. If None, the file is a single object shown on `close`.
+        """
         if not S3_ENABLED:
             raise ImportError("boto3 must be installed for S3 support.")
+        if part_size < S3_MIN_PART_SIZE:
+            raise ValueError('part_size should be at least {} bytes, got {}'.format(S3_MIN_PART_SIZE, part_size))
         self.path = path
-        self.buffer = io.BytesIO()
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self._client_options = client_options or {}
+        self.flush_bytes = flush_bytes
+        self._index = 0
+        self._object_bytes = 0
+        self._upload_id = None
+        self._parts = []
+        self._closed = False
 
     def __del__(self):
         self.close()
 
     def bucket_and_path(self):
-        bp = self.path.split("/")
-        bucket = bp[0]
-        path = self.path[1 + len(bucket):]
+        path = self.path
+        if path.startswith('s3://'):
+            path = path[len('s3://'):]
+        bucket, _, path = path.partition('/')
         return bucket, path
 
+    def _bucket_and_key(self):
+        bucket, path = self.bucket_and_path()
+        if self._index:
+            path = '{}.{:06d}'.format(path, self._index)
+        return bucket, path
+
+    def _request(self, operation, **kwargs):
+        body = kwargs.get('Body')
+        response = getattr(s3_clients.get(**self._client_options), operation)(**kwargs)
+        s3_clients.record(operation, 0 if body is None else len(body))
+        return response
+
     def write(self, val):
-        self.buffer.write(val)
+        self.buffer += val
+        self._object_bytes += len(val)
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+
+    def _upload_part(self):
+        bucket, path = self._bucket_and_key()
+        if self._upload_id is None:
+            self._upload_id = self._request('create_multipart_upload', Bucket=bucket, Key=path)['UploadId']
+        number = len(self._parts) + 1
+        response = self._request('upload_part', Bucket=bucket, Key=path, UploadId=self._upload_id,
+                                 PartNumber=number, Body=bytes(self.buffer))
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': number})
+        self.buffer = bytearray()
 
     def flush(self):
-        s3 = boto3.client('s3')
-        bucket, path = self.bucket_and_path()
-        s3.upload_fileobj(self.buffer, bucket, path)
+        # A partial part cannot be made visible without completing the object.
+        if self.flush_bytes is not None and self._object_bytes >= self.flush_bytes:
+            self._complete_object()
+            self._index += 1
+            self._object_bytes = 0
+            self._upload_id = None
+            self._parts = []
 
     def close(self):
-        self.flush()
+        if getattr(self, '_closed', True):
+            return
+        self._closed = True
+        # After a flush which completed an object, only start another one for new data.
+        if self._object_bytes or not self._index:
+            self._complete_object()
+
+    def _complete_object(self):
+        bucket, path = self._bucket_and_key()
+        if self._upload_id is None:
+            self._request('put_object', Bucket=bucket, Key=path, Body=bytes(self.buffer))
+            self.buffer = bytearray()
+            return
+        try:
+            if self.buffer:
+                self._upload_part()
+            self._request('complete_multipart_upload', Bucket=bucket, Key=path, UploadId=self._upload_id,
+                          MultipartUpload={'Parts': self._parts})
+        except Exception:
+            self._request('abort_multipart_upload', Bucket=bucket, Key=path, UploadId=self._upload_id)
+            raise
 
 
 class S3RecordWriterFactory(object):
-    """Factory for event protocol buffer files to S3."""
+    """Factory for event protocol buffer files to S3.
+
+    All its writers share the client of `s3_clients` selected by
+    ``client_options``, e.g. to use another endpoint or a larger connection
+    pool::
+
+        register_writer_factory('s3', S3RecordWriterFactory(
+            endpoint_url='http://localhost:9000', max_pool_connections=50))
+    """
+
+    def __init__(self, part_size=S3_MIN_PART_SIZE, flush_bytes=S3_MIN_PART_SIZE, **client_options):
+        """
+        Args:
+          part_size: Integer. Size of the uploaded parts in bytes.
+          flush_bytes: Integer. Size from which a flush completes the current
+            object, see `S3RecordWriter`.
+          **client_options: Keyword arguments of `S3ClientCache.get`.
+        """
+        self.part_size = part_size
+        self.flush_bytes = flush_bytes
+        self.client_options = client_options
 
     def open(self, path):
-        return S3RecordWriter(path)
+        return S3RecordWriter(path, self.part_size, self.client_options, self.flush_bytes)
 
     def directory_check(self, path):
         # S3 doesn't need directories created before files are added
@@ -97,28 +290,167 @@ class S3RecordWriterFactory(object):
 
 register_writer_factory("s3", S3RecordWriterFactory())
 
+# URL prefixes handled by `FsspecRecordWriterFactory` by default.
+FSSPEC_PREFIXES = ('gs', 'gcs', 'hdfs', 'az', 'abfs', 'memory', 'file')
+
+# fsspec protocols whose files can be opened in append mode.
+_FSSPEC_APPEND_PROTOCOLS = ('file', 'local', 'memory', 'hdfs')
+
+
+class FsspecRecordWriter(object):
+    """Writes tensorboard protocol buffer files with fsspec.
+
+    Remote file systems (gs, az, ...) buffer the writes and send them in
+    blocks of ``block_size`` bytes, so at most about one block is held in
+    memory.
+    """
+
+    def __init__(self, path, block_size=None, append=False, **storage_options):
+        """
+        Args:
+          path: A string. URL of the file, e.g. ``gs://bucket/run/events``.
+          block_size: Integer. Size of the blocks sent to remote file systems,
+            the file system's default if None.
+          append: Boolean. Add to the end of an existing file.
+          **storage_options: Arguments of the fsspec file system.
+        """
+        if not FSSPEC_ENABLED:
+            raise ImportError("fsspec must be installed for {} support.".format(path.split(':')[0]))
+        self.path = path
+        fs, fs_path = url_to_fs(path, **storage_options)
+        self._file = fs.open(fs_path, 'ab' if append else 'wb', block_size=block_size)
+
+    def write(self, val):
+        self._file.write(val)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class FsspecRecordWriterFactory(object):
+    """Factory for event protocol buffer files on the file systems of fsspec.
+
+    One factory can serve any protocol, to pass options to a file system
+    register its own::
+
+        register_writer_factory('hdfs', FsspecRecordWriterFactory(
+            block_size=64 << 20, host='namenode', port=8020))
+    """
+
+    def __init__(self, block_size=None, **storage_options):
+        """
+        Args:
+          block_size: Integer. Size of the blocks sent to remote file systems.
+          **storage_options: Arguments of the fsspec file systems.
+        """
+        self.block_size = block_size
+        self.storage_options = storage_options
+
+    def open(self, path, append=False):
+        return FsspecRecordWriter(path, self.block_size, append, **self.storage_options)
+
+    def supports_append(self, path):
+        return path.split(':')[0] in _FSSPEC_APPEND_PROTOCOLS
+
+    def directory_check(self, path):
+        if not FSSPEC_ENABLED:
+            raise ImportError("fsspec must be installed for {} support.".format(path.split(':')[0]))
+        fs, fs_path = url_to_fs(path, **self.storage_options)
+        fs.makedirs(fs_path, exist_ok=True)
+
+
+if FSSPEC_ENABLED:
+    for _prefix in FSSPEC_PREFIXES:
+        register_writer_factory(_prefix, FsspecRecordWriterFactory())
+
 
 class RecordWriter(object):
-    def __init__(self, path, flush_secs=2):
+    """Writes records in the TFRecord format used by event files.
+
+    Each record is framed as its length, the masked CRC of the length, the
+    payload and the masked CRC of the payload. Records are framed in memory and
+    handed to the file in batches, and the file is only flushed every
+    ``flush_secs`` seconds or when :meth:`flush` or :meth:`close` is called.
+
+    Durability: a record is guaranteed to have reached the operating system
+    (or the remote backend) only once a flush happened after it was written.
+    If the process dies, the records written since the last flush are lost;
+    records already in the file are never rewritten.
+    """
+
+    def __init__(self, path, flush_secs=2, max_pending_bytes=1 << 20, append=False):
+        """
+        Args:
+          path: A string. File path or URL of a registered writer factory.
+          flush_secs: Number. How often, in seconds, to flush the file.
+          max_pending_bytes: Integer. Framed records are handed to the file
+            once this many bytes are pending, without flushing it.
+          append: Boolean. Add the records to the end of an existing local
+            file instead of truncating it.
+        """
         self._name_to_tf_name = {}
         self._tf_names = set()
         self.path = path
-        # TODO. flush every flush_secs, not every time.
         self.flush_secs = flush_secs
+        self.max_pending_bytes = max_pending_bytes
+        self._pending = []
+        self._pending_bytes = 0
+        self._next_flush_time = time.time() + flush_secs
+        self._lock = threading.Lock()
         self._writer = None
-        self._writer = open_file(path)
+        self._writer = open_file(path, append)
 
     def write(self, event_str):
-        w = self._writer.write
-        header = struct.pack('Q', len(event_str))
-        w(header)
-        w(struct.pack('I', masked_crc32c(header)))
-        w(event_str)
-        w(struct.pack('I', masked_crc32c(event_str)))
+        self._append(_frame(event_str))
+
+    def write_batch(self, event_strs):
+        """Writes several records as one contiguous chunk."""
+        self._append(b''.join(_frame(event_str) for event_str in event_strs))
+
+    def _append(self, data):
+        with self._lock:
+            self._pending.append(data)
+            self._pending_bytes += len(data)
+            if time.time() >= self._next_flush_time:
+                self._flush()
+            elif self._pending_bytes >= self.max_pending_bytes:
+                self._write_pending()
+
+    def _write_pending(self):
+        if self._pending:
+            self._writer.write(b''.join(self._pending))
+            self._pending = []
+            self._pending_bytes = 0
+
+    def _flush(self):
+        self._write_pending()
         self._writer.flush()
+        self._next_flush_time = time.time() + self.flush_secs
+
+    def flush(self):
+        """Writes the pending records and flushes the file."""
+        with self._lock:
+            if self._writer is not None:
+                self._flush()
 
     def close(self):
-        self._writer.close()
+        with self._lock:
+            if self._writer is None:
+                return
+            self._flush()
+            self._writer.close()
+            self._writer = None
+
+
+def _frame(event_str):
+    header = struct.pack('<Q', len(event_str))
+    return b''.join((header,
+                     struct.pack('<I', masked_crc32c(header)),
+                     event_str,
+                     struct.pack('<I', masked_crc32c(event_str))))
 
 
 def masked_crc32c(data):
@@ -0,0 +1,142 @@
+"""In-memory history of the scalars logged with `SummaryWriter.add_scalars`."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import random
+
+import numpy as np
+
+# Ways of keeping a bounded history, see `ScalarHistory`.
+HISTORY_MODES = ('ring', 'reservoir')
+
+# Stored step of the scalars logged without a global step.
+_NO_STEP = np.iinfo(np.int64).min
+
+_INITIAL_ROWS = 64
+
+
+class ScalarHistory(object):
+    """The (timestamp, step, value) rows of one tag, stored in columns.
+
+    Timestamps are kept as float64, steps as int64 and values as float32, in
+    numpy buffers which grow as rows are added: about 20 bytes per row instead
+    of a Python list of three objects.
+
+    With a ``capacity`` the history is bounded. In 'ring' mode the oldest rows
+    are overwritten by new ones; in 'reservoir' mode a uniform random sample of
+    all the rows appended so far is kept (reservoir sampling), so the history
+    still covers the whole run.
+    """
+
+    def __init__(self, capacity=None, mode='ring', seed=None):
+        """
+        Args:
+          capacity: Integer. Maximum number of rows kept, unbounded if None.
+          mode: A string, one of `HISTORY_MODES`.
+          seed: Seed of the random sampling of the 'reservoir' mode.
+        """
+        if mode not in HISTORY_MODES:
+            raise ValueError('mode should be one of {}, got {}'.format(HISTORY_MODES, mode))
+        if capacity is not None and capacity <= 0:
+            raise ValueError('capacity should be positive, got {}'.format(capacity))
+        self.capacity = capacity
+        self.mode = mode
+        # Number of rows appended so far, kept or not.
+        self.count = 0
+        self._size = 0
+        # Index of the oldest row once the ring is full.
+        self._start = 0
+        self._random = random.Random(seed)
+        rows = _INITIAL_ROWS if capacity is None else min(capacity, _INITIAL_ROWS)
+        self._timestamps = np.empty(rows, dtype=np.float64)
+        self._steps = np.empty(rows, dtype=np.int64)
+        self._values = np.empty(rows, dtype=np.float32)
+        # Order of arrival of the sampled rows, the reservoir keeps them unordered.
+        self._order = np.empty(rows, dtype=np.int64) if mode == 'reservoir' else None
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp, step, value):
+        """Adds a row. ``step`` may be None."""
+        if self.capacity is None or self._size < self.capacity:
+            if self._size == len(self._timestamps):
+                self._grow()
+            i = self._size
+            self._size += 1
+        elif self.mode == 'ring':
+            i = self._start
+            self._start = (self._start + 1) % self.capacity
+        else:
+            i = self._random.randint(0, self.count)
+            if i >= self.capacity:
+                self.count += 1
+                return
+        self._timestamps[i] = timestamp
+        self._steps[i] = _NO_STEP if step is None else step
+        self._values[i] = value
+        if self._order is not None:
+            self._order[i] = self.count
+        self.count += 1
+
+    def _grow(self):
+        rows = len(self._timestamps) * 2
+        if self.capacity is not None:
+            rows = min(rows, self.capacity)
+        self._timestamps = _resized(self._timestamps, rows)
+        self._steps = _resized(self._steps, rows)
+        self._values = _resized(self._values, rows)
+        if self._order is not None:
+            self._order = _resized(self._order, rows)
+
+    def columns(self):
+        """Returns the timestamps, steps and values in the order they were added.
+
+        Steps of rows added without a step are the minimum int64.
+        """
+        n = self._size
+        if self._order is not None:
+            index = np.argsort(self._order[:n], kind='stable')
+        elif self._start:
+            index = np.roll(np.arange(n), -self._start)
+        else:
+            return self._timestamps[:n], self._steps[:n], self._values[:n]
+        return self._timestamps[index], self._steps[index], self._values[index]
+
+    def rows(self):
+        """Returns the rows as ``[timestamp, step, value]`` lists of Python
+        numbers, with None for a missing step."""
+        return _to_rows(*self.columns())
+
+
+def _to_rows(timestamps, steps, values):
+    steps = [None if step == _NO_STEP else step for step in steps.tolist()]
+    return [list(row) for row in zip(timestamps.tolist(), steps, values.tolist())]
+
+
+def _resized(array, rows):
+    resized = np.empty(rows, dtype=array.dtype)
+    resized[:len(array)] = array
+    return resized
+
+
+def dump_json(histories, f, chunk_rows=4096):
+    """Writes ``{tag: [[timestamp, step, value], ...], ...}`` for a dict of
+    `ScalarHistory` to the text file ``f``, ``chunk_rows`` rows at a time so
+    that the whole document is never built in memory."""
+    f.write('{')
+    for i, (tag, history) in enumerate(histories.items()):
+        if i:
+            f.write(', ')
+        f.write(json.dumps(tag))
+        f.write(': [')
+        columns = history.columns()
+        for start in range(0, len(history), chunk_rows):
+            if start:
+                f.write(', ')
+            chunk = _to_rows(*(column[start:start + chunk_rows] for column in columns))
+            f.write(json.dumps(chunk)[1:-1])
+        f.write(']')
+    f.write('}')
@@ -0,0 +1,384 @@
+"""Spools the event files of remote log dirs to the local disk.
+
+By default the event files of ``s3://`` (or any other registered) log dirs are
+sent by the event logger thread itself, so a slow or failing network backs up
+the queue of pending events and eventually stalls training. After::
+
+    from tensorboardX.spooling import enable_spooling
+    enable_spooling('s3')
+
+the events are written to local segment files at disk speed and a background
+thread uploads the completed segments.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import errno
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+import weakref
+
+from .record_writer import REGISTERED_FACTORIES, register_writer_factory
+
+logger = logging.getLogger(__name__)
+
+# A spool directory holds a manifest per process, named after its pid.
+_MANIFEST = 'manifest.{}.json'
+
+# The factories of this process by spool directory.
+_factories = weakref.WeakValueDictionary()
+
+# Size of the chunks of a segment handed to the remote writer.
+_CHUNK_BYTES = 1 << 20
+
+
+def enable_spooling(prefix, spool_dir=None, **kwargs):
+    """Spools the files of the factory registered for ``prefix`` to local disk.
+
+    Args:
+      prefix: A string, e.g. ``'s3'``.
+      spool_dir: A string. Local directory of the segments and of the upload
+        manifest, a directory under the system temporary directory if None.
+      **kwargs: Other arguments of `SpoolingWriterFactory`.
+
+    Returns:
+      The `SpoolingWriterFactory` now registered for ``prefix``.
+    """
+    factory = REGISTERED_FACTORIES.get(prefix)
+    if factory is None:
+        raise ValueError('No writer factory is registered for {}'.format(prefix))
+    if isinstance(factory, SpoolingWriterFactory):
+        return factory
+    if spool_dir is None:
+        spool_dir = os.path.join(tempfile.gettempdir(), 'tensorboardX-spool', prefix)
+    spooling = SpoolingWriterFactory(factory, spool_dir, **kwargs)
+    register_writer_factory(prefix, spooling)
+    return spooling
+
+
+class SpoolingWriterFactory(object):
+    """Writes the files of another writer factory to local disk first.
+
+    Each file is written to segment files in ``spool_dir``. A segment is
+    complete once it holds ``segment_bytes`` bytes, is older than
+    ``segment_secs`` seconds or its file is closed; a background thread then
+    sends it with the wrapped factory, retrying failed uploads with exponential
+    backoff. The first segment of a file is uploaded under the file's name and
+    the following ones under the name followed by ``.000001``, ``.000002``,
+    ... so that names sort in the order the segments were written, which is the
+    order TensorBoard reads event files in. Segments end at record boundaries,
+    so each one is a valid event file.
+
+    The segments not uploaded yet are listed in a manifest of the process in
+    ``spool_dir``, so several processes can share a spool directory. A factory
+    created on the directory, e.g. after a crash, uploads the segments left by
+    the processes which are not running anymore. Only one factory of a process
+    can use a spool directory.
+    """
+
+    def __init__(self, factory, spool_dir, segment_bytes=64 << 20, segment_secs=600, retries=5, backoff_secs=1.0,
+                 max_backoff_secs=60.0):
+        """
+        Args:
+          factory: The writer factory the segments are uploaded with.
+          spool_dir: A string. Local directory of the segments and manifest.
+          segment_bytes: Integer. Size from which a segment is complete.
+          segment_secs: Number. Age in seconds from which a segment is complete.
+          retries: Integer. Number of times a failed upload is retried. A
+            segment which still fails stays in the manifest.
+          backoff_secs: Number. Wait before the first retry, doubled at each
+            following one.
+          max_backoff_secs: Number. Longest wait between two retries.
+        """
+        self.factory = factory
+        self.spool_dir = spool_dir
+        self.segment_bytes = segment_bytes
+        self.segment_secs = segment_secs
+        self.retries = retries
+        self.backoff_secs = backoff_secs
+        self.max_backoff_secs = max_backoff_secs
+        key = os.path.realpath(spool_dir)
+        if _factories.get(key) is not None:
+            raise ValueError('{} is already used by another factory'.format(spool_dir))
+        _factories[key] = self
+        if not os.path.exists(spool_dir):
+            os.makedirs(spool_dir)
+        self._pid = os.getpid()
+        # A manifest of this pid can only be left by a process which had the
+        # same pid, e.g. in a restarted container; it is taken over as is.
+        self._manifest = _Manifest(os.path.join(spool_dir, _MANIFEST.format(self._pid)))
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._queue = collections.deque()
+        self._uploader = None
+        self._stats = {'uploaded': 0, 'retries': 0, 'failed': 0}
+        self._resume()
+
+    def open(self, path):
+        return _SpoolWriter(self, path)
+
+    def directory_check(self, path):
+        return self.factory.directory_check(path)
+
+    def get_stats(self):
+        """Returns counters about the uploads as a dict.
+        *  `uploaded`: Number of segments uploaded.
+        *  `retries`: Number of failed uploads which were retried.
+        *  `failed`: Number of segments given up on after all the retries.
+        *  `pending`: Number of segments in the manifest.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pending'] = len(self._manifest)
+        return stats
+
+    def wait(self, timeout=None):
+        """Waits until the completed segments have been uploaded or given up on.
+
+        Returns:
+          True if no upload is running anymore.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while self._uploader is not None:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+            return True
+
+    def _resume(self):
+        for name, entry in self._manifest.items():
+            self._resume_segment(name, entry)
+        for filename in sorted(os.listdir(self.spool_dir)):
+            pid = _manifest_pid(filename)
+            if pid is None or filename == os.path.basename(self._manifest.path):
+                continue
+            if pid != self._pid and _process_exists(pid):
+                continue
+            # Renamed first so that only one of the processes resuming it at
+            # the same time takes the manifest over.
+            claimed = os.path.join(self.spool_dir, 'manifest.{}.{}'.format(self._pid, filename[len('manifest.'):]))
+            try:
+                os.rename(os.path.join(self.spool_dir, filename), claimed)
+            except OSError:
+                continue
+            for name, entry in _Manifest(claimed).items():
+                self._manifest.add(name, entry['remote'], entry['complete'])
+                self._resume_segment(name, entry)
+            os.remove(claimed)
+
+    def _resume_segment(self, name, entry):
+        local = os.path.join(self.spool_dir, name)
+        if not os.path.exists(local):
+            self._manifest.remove(name)
+            return
+        if not entry['complete']:
+            # The process which wrote the segment died, only keep its whole records.
+            _truncate_to_records(local)
+            self._manifest.complete(name)
+        self._submit(name, entry['remote'])
+
+    def _submit(self, name, remote):
+        with self._lock:
+            self._queue.append((name, remote))
+            if self._uploader is None:
+                # Not a daemon, so that the interpreter uploads the last segments before exiting.
+                self._uploader = threading.Thread(target=self._upload_loop, name='tensorboardX-spool-uploader')
+                self._uploader.start()
+
+    def _upload_loop(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._uploader = None
+                    self._idle.notify_all()
+                    return
+                name, remote = self._queue.popleft()
+            self._upload_with_retries(name, remote)
+
+    def _upload_with_retries(self, name, remote):
+        local = os.path.join(self.spool_dir, name)
+        for attempt in range(self.retries + 1):
+            try:
+                self._upload(local, remote)
+            except Exception:
+                if attempt == self.retries:
+                    logger.exception('Uploading %s failed, it is kept in %s.', remote, local)
+                    self._count('failed')
+                    return
+                self._count('retries')
+                time.sleep(min(self.backoff_secs * 2 ** attempt, self.max_backoff_secs))
+            else:
+                self._manifest.remove(name)
+                os.remove(local)
+                self._count('uploaded')
+                return
+
+    def _upload(self, local, remote):
+        writer = self.factory.open(remote)
+        with open(local, 'rb') as f:
+            while True:
+                chunk = f.read(_CHUNK_BYTES)
+                if not chunk:
+                    break
+                writer.write(chunk)
+        writer.close()
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+
+class _SpoolWriter(object):
+    """Writes one file of a `SpoolingWriterFactory` to its local segments."""
+
+    def __init__(self, spooling, path):
+        self._spooling = spooling
+        self.path = path
+        self._key = hashlib.md5(path.encode('utf-8')).hexdigest()
+        self._index = 0
+        self._file = None
+
+    def _open_segment(self):
+        self._name = '{}.{}.{}'.format(self._spooling._pid, self._key, self._index)
+        remote = self.path if self._index == 0 else '{}.{:06d}'.format(self.path, self._index)
+        self._spooling._manifest.add(self._name, remote)
+        self._remote = remote
+        self._file = open(os.path.join(self._spooling.spool_dir, self._name), 'wb')
+        self._size = 0
+        self._opened = time.time()
+
+    def _finish_segment(self):
+        self._file.close()
+        self._file = None
+        self._index += 1
+        self._spooling._manifest.complete(self._name)
+        self._spooling._submit(self._name, self._remote)
+
+    def _segment_done(self):
+        spooling = self._spooling
+        return self._size >= spooling.segment_bytes or time.time() - self._opened >= spooling.segment_secs
+
+    def write(self, data):
+        # Every write holds whole records, so segments are cut between writes.
+        if self._file is None:
+            self._open_segment()
+        self._file.write(data)
+        self._size += len(data)
+        if self._segment_done():
+            self._finish_segment()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+            if self._segment_done():
+                self._finish_segment()
+
+    def close(self):
+        if self._file is None and self._index == 0:
+            # Still create the remote file when nothing was written.
+            self._open_segment()
+        if self._file is not None:
+            self._finish_segment()
+
+
+class _Manifest(object):
+    """The segments of a process not uploaded yet, kept in a JSON file.
+
+    Maps the name of each segment to its remote path and whether it is
+    complete. The file is rewritten atomically on every change.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self._entries = json.load(f)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def items(self):
+        with self._lock:
+            return sorted(self._entries.items())
+
+    def add(self, name, remote, complete=False):
+        with self._lock:
+            self._entries[name] = {'remote': remote, 'complete': complete}
+            self._save()
+
+    def complete(self, name):
+        with self._lock:
+            self._entries[name]['complete'] = True
+            self._save()
+
+    def remove(self, name):
+        with self._lock:
+            del self._entries[name]
+            self._save()
+
+    def _save(self):
+        # The manifest has a name of its own process, and so its temporary file.
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._entries, f)
+        if hasattr(os, 'replace'):
+            os.replace(tmp, self.path)
+        else:
+            # Python 2 only has rename, which cannot replace a file on Windows.
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(tmp, self.path)
+
+
+def _manifest_pid(filename):
+    """Returns the pid of the process owning the manifest ``filename`` of a
+    spool directory, None if it is not a manifest."""
+    if not filename.startswith('manifest.') or not filename.endswith('.json'):
+        return None
+    pid = filename[len('manifest.'):-len('.json')].split('.')[0]
+    return int(pid) if pid.isdigit() else None
+
+
+def _process_exists(pid):
+    """Returns True if a process with the given pid is running."""
+    if os.name == 'nt':
+        # os.kill(pid, 0) sends a CTRL+C event to the process on Windows.
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _truncate_to_records(path):
+    """Drops the incomplete record at the end of the record file ``path``."""
+    size = os.path.getsize(path)
+    offset = 0
+    with open(path, 'r+b') as f:
+        while offset + 8 <= size:
+            f.seek(offset)
+            length, = struct.unpack('<Q', f.read(8))
+            end = offset + 16 + length
+            if end > size:
+                break
+            offset = end
+        f.truncate(offset)
@@ -34,10 +34,14 @@ from __future__ import division
 from __future__ import print_function
 
 import bisect
+import collections
 import logging
 import numpy as np
+import operator
 import os
 import re as _re
+import six
+import threading
 
 # pylint: disable=unused-import
 from six import StringIO
@@ -50,7 +54,7 @@ from .proto.tensor_shape_pb2 import TensorShapeProto
 from .proto.plugin_pr_curve_pb2 import PrCurvePluginData
 from .proto.plugin_text_pb2 import TextPluginData
 from .proto import layout_pb2
-from .x2num import make_np
+from .x2num import make_np, make_scalar, _prepare_video
 
 _INVALID_TAG_CHARACTERS = _re.compile(r'[^-/\w\.]')
 
@@ -60,6 +64,14 @@ def _calc_scale_factor(tensor):
     return 1 if converted.dtype == np.uint8 else 255
 
 
+def _scale_to_uint8(tensor, scale_factor):
+    # Same as (tensor.astype(np.float32) * scale_factor).astype(np.uint8), but
+    # the ufunc casts through small buffers instead of full float32 copies.
+    out = np.empty(tensor.shape, dtype=np.uint8)
+    np.multiply(tensor, scale_factor, out=out, dtype=np.float32, casting='unsafe')
+    return out
+
+
 def _clean_tag(name):
     # In the past, the first argument to summary ops was a tag, which allowed
     # arbitrary characters. Now we are changing the first argument to be the node
@@ -68,14 +80,97 @@ def _clean_tag(name):
     # usage, because a much smaller set of characters are allowed in node names.
     # This function replaces all illegal characters with _s, and logs a warning.
     # It also strips leading slashes from the name.
-    if name is not None:
-        new_name = _INVALID_TAG_CHARACTERS.sub('_', name)
-        new_name = new_name.lstrip('/')  # Remove leading slashes
-        if new_name != name:
-            logging.info(
-                'Summary name %s is illegal; using %s instead.' % (name, new_name))
-            name = new_name
-    return name
+    # Results are cached, so the warning is logged once per tag (until the tag
+    # is evicted from the cache).
+    if name is None:
+        return None
+    return _tag_cache.get(name)
+
+
+def _normalize_tag(name):
+    new_name = _INVALID_TAG_CHARACTERS.sub('_', name)
+    new_name = new_name.lstrip('/')  # Remove leading slashes
+    if new_name != name:
+        logging.info(
+            'Summary name %s is illegal; using %s instead.' % (name, new_name))
+    return new_name
+
+
+class _TagCache(object):
+    """Bounded LRU cache of cleaned tags, safe to use from several threads.
+
+    Hits do not take the lock: reading and reordering an OrderedDict are single
+    operations under the GIL. The counters are statistics and may miss a few
+    concurrent hits.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._cleaned = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _move_to_end(self, name):
+        try:
+            self._cleaned.move_to_end(name)
+        except AttributeError:  # Python 2
+            self._cleaned[name] = self._cleaned.pop(name)
+
+    def get(self, name):
+        cleaned = self._cleaned.get(name)
+        if cleaned is not None:
+            self.hits += 1
+            try:
+                self._move_to_end(name)
+            except KeyError:  # evicted by another thread in the meantime
+                pass
+            return cleaned
+        with self._lock:
+            self.misses += 1
+            cleaned = _normalize_tag(name)
+            if name not in self._cleaned and len(self._cleaned) >= self.max_size:
+                self._cleaned.popitem(last=False)
+            self._cleaned[name] = cleaned
+        return cleaned
+
+    def clear(self):
+        with self._lock:
+            self._cleaned.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'size': len(self._cleaned),
+                    'max_size': self.max_size,
+                    'hit_rate': float(self.hits) / lookups if lookups else 0.0}
+
+
+_TAG_CACHE_SIZE = 4096
+_tag_cache = _TagCache(_TAG_CACHE_SIZE)
+
+
+def tag_cache_stats():
+    """Returns the hits, misses, size, max_size and hit_rate of the cache of cleaned tags."""
+    return _tag_cache.stats()
+
+
+# Cleaned tag lists of `scalars`, keyed by the tuple of tags. Training loops
+# log the same lists over and over, so this stays small.
+_cleaned_tag_lists = {}
+_MAX_CLEANED_TAG_LISTS = 128
+
+
+def _clean_tags(tags):
+    cleaned = _cleaned_tag_lists.get(tags)
+    if cleaned is None:
+        if len(_cleaned_tag_lists) >= _MAX_CLEANED_TAG_LISTS:
+            _cleaned_tag_lists.clear()
+        cleaned = _cleaned_tag_lists[tags] = [_clean_tag(tag) for tag in tags]
+    return cleaned
 
 
 def _draw_single_box(image, xmin, ymin, xmax, ymax, display_str, font, color='black', color_text='black', thickness=2):
@@ -115,12 +210,43 @@ def scalar(name, scalar, collections=None):
       ValueError: If tensor has the wrong shape or type.
     """
     name = _clean_tag(name)
-    scalar = make_np(scalar)
-    assert(scalar.squeeze().ndim == 0), 'scalar should be 0D'
-    scalar = float(scalar)
+    scalar = make_scalar(scalar)
     return Summary(value=[Summary.Value(tag=name, simple_value=scalar)])
 
 
+def scalars(tags, values):
+    """Outputs a `Summary` protocol buffer with one scalar value per tag.
+
+    Args:
+      tags: A sequence of tags.
+      values: The value of each tag, either a sequence of scalars or a tensor
+        with one element per tag.
+    Returns:
+      A `Summary` protobuf with ``len(tags)`` values.
+    Raises:
+      ValueError: If there is not one value per tag.
+    """
+    summary = Summary()
+    _add_scalar_values(summary, tags, values)
+    return summary
+
+
+def _add_scalar_values(summary, tags, values):
+    # Appends the values of `scalars` to the `Summary` message `summary`, which
+    # lets the writer fill an event's summary without copying it.
+    names = _clean_tags(tuple(tags))
+    if isinstance(values, (list, tuple)):
+        values = [make_scalar(value) for value in values]
+    else:
+        values = make_np(values).astype(np.float64).reshape(-1).tolist()
+    if len(values) != len(names):
+        raise ValueError('Got {} values for {} tags.'.format(len(values), len(names)))
+    # value.add builds the entries in place, Summary(value=[...]) would copy each one.
+    add_value = summary.value.add
+    for name, value in zip(names, values):
+        add_value(tag=name, simple_value=value)
+
+
 def histogram(name, values, bins, collections=None):
     # pylint: disable=line-too-long
     """Outputs a `Summary` protocol buffer with a histogram.
@@ -132,7 +258,8 @@ def histogram(name, values, bins, collections=None):
       name: A name for the generated node. Will also serve as a series name in
         TensorBoard.
       values: A real numeric `Tensor`. Any shape. Values to use to
-        build the histogram.
+        build the histogram. A `HistogramAccumulator` is used as is and
+        `bins` is ignored.
       collections: Optional list of graph collections keys. The new summary op is
         added to these collections. Defaults to `[GraphKeys.SUMMARIES]`.
     Returns:
@@ -140,45 +267,222 @@ def histogram(name, values, bins, collections=None):
       buffer.
     """
     name = _clean_tag(name)
-    values = make_np(values)
-    hist = make_histogram(values.astype(float), bins)
+    if isinstance(values, HistogramAccumulator):
+        hist = values.to_proto()
+    else:
+        hist = make_histogram(make_np(values), bins)
     return Summary(value=[Summary.Value(tag=name, histo=hist)])
 
 
+# Number of values processed at once by make_histogram. Each block is converted
+# to float64 on its own, so no float64 copy of the whole input is made.
+_HISTOGRAM_BLOCK_SIZE = 1 << 16
+
+
+def _float64_blocks(values):
+    for start in range(0, values.size, _HISTOGRAM_BLOCK_SIZE):
+        yield values[start:start + _HISTOGRAM_BLOCK_SIZE].astype(np.float64, copy=False)
+
+
+def _tensorflow_bins():
+    # Exponential buckets, see generate_testdata.py in tensorflow/tensorboard
+    v = 1E-12
+    buckets = []
+    neg_buckets = []
+    while v < 1E20:
+        buckets.append(v)
+        neg_buckets.append(-v)
+        v *= 1.1
+    edges = np.array(neg_buckets[::-1] + [0] + buckets, dtype=np.float64)
+    edges.flags.writeable = False
+    return edges
+
+
+# Built once per process and shared by every writer.
+_TENSORFLOW_BINS = _tensorflow_bins()
+
+
+def default_bins():
+    """Returns the bucket edges used for ``bins='tensorflow'`` as a read-only array."""
+    return _TENSORFLOW_BINS
+
+
+def _tensorflow_bin_counts(block):
+    # Same bucketing as np.histogram(block, _TENSORFLOW_BINS): a value falls in
+    # bucket i when edges[i] <= value < edges[i + 1], the last bucket also holds
+    # the last edge and values outside the edges (or NaN) are dropped. The edges
+    # are known to be sorted and finite, so their positions in the sorted block
+    # give the counts directly without np.histogram's validation of the edges.
+    block = np.sort(block)
+    cumulative = block.searchsorted(_TENSORFLOW_BINS, side='left')
+    cumulative[-1] = block.searchsorted(_TENSORFLOW_BINS[-1], side='right')
+    return np.diff(cumulative)
+
+
+def _is_tensorflow_bins(bins):
+    return bins is _TENSORFLOW_BINS or (isinstance(bins, six.string_types) and bins == 'tensorflow')
+
+
 def make_histogram(values, bins):
     """Convert values into a histogram proto using logic from histogram.cc."""
     if values.size == 0:
         raise ValueError('The input has no element.')
     values = values.reshape(-1)
-    counts, limits = np.histogram(values, bins=bins)
-    limits = limits[1:]
+    if _is_tensorflow_bins(bins) or (not isinstance(bins, six.string_types) and np.ndim(bins) != 0):
+        accumulator = HistogramAccumulator(bins)
+        accumulator.update(values)
+        return accumulator.to_proto()
+
+    # min, max, sum and sum of squares are computed block by block while the
+    # block is in cache, so the input is read once for all of them.
+    vmin, vmax = np.inf, -np.inf
+    vsum = sum_sq = 0.0
+    for block in _float64_blocks(values):
+        vmin = np.minimum(vmin, block.min())
+        vmax = np.maximum(vmax, block.max())
+        vsum += block.sum()
+        sum_sq += block.dot(block)
+
+    if isinstance(bins, six.string_types):
+        # Bin estimators ('auto', 'fd', ...) need to see all the data at once.
+        counts, limits = np.histogram(values.astype(np.float64, copy=False), bins=bins)
+    else:
+        # Same edges as np.histogram(values, bins) would pick from the data.
+        counts = None
+        for block in _float64_blocks(values):
+            block_counts, limits = np.histogram(block, bins=operator.index(bins), range=(vmin, vmax))
+            counts = block_counts if counts is None else counts + block_counts
+    return _histogram_proto(vmin, vmax, values.size, vsum, sum_sq, counts, limits)
+
+
+def _histogram_proto(vmin, vmax, num, vsum, sum_sq, counts, edges):
     # void Histogram::EncodeToProto in histogram.cc
-    for i, c in enumerate(counts):
-        if c > 0:
-            start = max(0, i - 1)
-            break
-
-    for i, c in enumerate(reversed(counts)):
-        if c > 0:
-            end = counts.size - i
-            break
-
+    limits = edges[1:]
+    nonzero = np.flatnonzero(counts)
+    if nonzero.size == 0:
+        raise ValueError('The histogram is empty, please file a bug report.')
+    start = max(0, nonzero[0] - 1)
+    end = nonzero[-1] + 1
     counts = counts[start:end]
     limits = limits[start:end]
 
-    if counts.size == 0 or limits.size == 0:
-        raise ValueError('The histogram is empty, please file a bug report.')
-
-    sum_sq = values.dot(values)
-    return HistogramProto(min=values.min(),
-                          max=values.max(),
-                          num=len(values),
-                          sum=values.sum(),
+    return HistogramProto(min=vmin,
+                          max=vmax,
+                          num=num,
+                          sum=vsum,
                           sum_squares=sum_sq,
                           bucket_limit=limits.tolist(),
                           bucket=counts.tolist())
 
 
+class HistogramAccumulator(object):
+    """Builds a histogram incrementally from chunks of values.
+
+    The counts and statistics of every chunk passed to :meth:`update` are added
+    up, so a histogram over many tensors (e.g. the activations of several
+    micro-batches) can be logged without concatenating them. Accumulators with
+    the same edges can be combined with :meth:`merge`; they only hold numpy
+    arrays and floats, so they can be pickled and merged across processes.
+
+    The result is the same as :func:`make_histogram` on all the values at once.
+
+    Args:
+        bins: ``'tensorflow'`` for the default TensorBoard buckets, or a
+          monotonically increasing sequence of bucket edges. Edges estimated
+          from the data (an int or an estimator name) are not supported because
+          they would differ between chunks.
+
+    Example::
+
+        acc = HistogramAccumulator()
+        for batch in loader:
+            acc.update(model(batch))
+        acc.emit(writer, 'activations', global_step)
+    """
+
+    def __init__(self, bins='tensorflow'):
+        if _is_tensorflow_bins(bins):
+            self._edges = _TENSORFLOW_BINS
+        elif isinstance(bins, six.string_types) or np.ndim(bins) != 1:
+            raise ValueError('HistogramAccumulator needs fixed bucket edges or \'tensorflow\', got {!r}'.format(bins))
+        else:
+            self._edges = np.array(bins, dtype=np.float64)
+            if self._edges.size < 2 or np.any(np.diff(self._edges) < 0):
+                raise ValueError('bins must be a monotonically increasing sequence of at least two edges.')
+        self.reset()
+
+    @property
+    def edges(self):
+        """The bucket edges as a float64 array."""
+        return self._edges
+
+    def reset(self):
+        """Forgets all the values seen so far."""
+        self.min = np.inf
+        self.max = -np.inf
+        self.num = 0
+        self.sum = 0.0
+        self.sum_squares = 0.0
+        self.counts = np.zeros(self._edges.size - 1, dtype=np.int64)
+
+    def update(self, values):
+        """Adds ``values`` (numpy array, torch tensor, ...; any shape) to the histogram.
+
+        Returns:
+            The accumulator itself, so calls can be chained.
+        """
+        values = make_np(values).reshape(-1)
+        tensorflow_bins = self._edges is _TENSORFLOW_BINS
+        for block in _float64_blocks(values):
+            self.min = np.minimum(self.min, block.min())
+            self.max = np.maximum(self.max, block.max())
+            self.sum += block.sum()
+            self.sum_squares += block.dot(block)
+            if tensorflow_bins:
+                self.counts += _tensorflow_bin_counts(block)
+            else:
+                self.counts += np.histogram(block, bins=self._edges)[0]
+        self.num += values.size
+        return self
+
+    def merge(self, other):
+        """Adds the values seen by another accumulator with the same edges.
+
+        Returns:
+            The accumulator itself, so calls can be chained.
+        """
+        if other._edges is not self._edges and not np.array_equal(other._edges, self._edges):
+            raise ValueError('Cannot merge histograms with different bucket edges.')
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.num += other.num
+        self.sum += other.sum
+        self.sum_squares += other.sum_squares
+        self.counts += other.counts
+        return self
+
+    def to_proto(self):
+        """Returns the accumulated histogram as a `HistogramProto`."""
+        if self.num == 0:
+            raise ValueError('The input has no element.')
+        return _histogram_proto(self.min, self.max, self.num, self.sum, self.sum_squares, self.counts, self._edges)
+
+    def emit(self, writer, tag, global_step=None, walltime=None):
+        """Logs the accumulated histogram with ``writer.add_histogram``."""
+        writer.add_histogram(tag, self, global_step, walltime=walltime)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._edges is _TENSORFLOW_BINS:
+            state['_edges'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._edges is None:
+            self._edges = _TENSORFLOW_BINS
+
+
 def image(tag, tensor, rescale=1):
     """Outputs a `Summary` protocol buffer with images.
     The summary has up to `max_images` summary values containing images. The
@@ -207,9 +511,8 @@ def image(tag, tensor, rescale=1):
     tag = _clean_tag(tag)
     tensor = make_np(tensor, 'IMG')
     # Do not assume that user passes in values in [0, 255], use data type to detect
-    scale_factor = _calc_scale_factor(tensor)
-    tensor = tensor.astype(np.float32)
-    tensor = (tensor * scale_factor).astype(np.uint8)
+    if tensor.dtype != np.uint8:
+        tensor = _scale_to_uint8(tensor, _calc_scale_factor(tensor))
     image = make_image(tensor, rescale=rescale)
     return Summary(value=[Summary.Value(tag=tag, image=image)])
 
@@ -264,22 +567,53 @@ def make_image(tensor, rescale=1, rois=None):
                          encoded_image_string=image_string)
 
 
-def video(tag, tensor, fps=4):
+def video(tag, tensor, fps=4, shared_palette=False, grid_shape=None):
     tag = _clean_tag(tag)
-    tensor = make_np(tensor, 'VID')
+    tensor = _prepare_video(make_np(tensor), grid_shape)
     # If user passes in uint8, then we don't need to rescale by 255
-    scale_factor = _calc_scale_factor(tensor)
-    tensor = tensor.astype(np.float32)
-    tensor = (tensor * scale_factor).astype(np.uint8)
-    video = make_video(tensor, fps)
+    if tensor.dtype != np.uint8:
+        tensor = _scale_to_uint8(tensor, _calc_scale_factor(tensor))
+    video = make_video(tensor, fps, shared_palette)
     return Summary(value=[Summary.Value(tag=tag, image=video)])
 
 
-def make_video(tensor, fps):
+def make_video(tensor, fps, shared_palette=False):
+    """Encodes a uint8 tensor of shape [T, H, W, C] into an animated GIF `Summary.Image`.
+
+    The GIF is built in memory with PIL. With ``shared_palette`` the palette is
+    computed once from the first frame and every frame is mapped to it, instead
+    of quantizing each frame on its own; this is faster and gives smaller files
+    when the colors do not change much over the clip. moviepy is used if PIL is
+    not installed.
+    """
     try:
-        import moviepy
+        from PIL import Image
     except ImportError:
-        print('add_video needs package moviepy')
+        return _make_video_moviepy(tensor, fps)
+    import io
+
+    t, h, w, c = tensor.shape
+    if c == 1:
+        frames = [Image.fromarray(frame[:, :, 0], 'L') for frame in tensor]
+    else:
+        frames = [Image.fromarray(frame[:, :, :3], 'RGB') for frame in tensor]
+    if shared_palette and c != 1:
+        palette = frames[0].quantize(colors=256)
+        frames = [frame.quantize(palette=palette) for frame in frames]
+
+    fio = io.BytesIO()
+    frames[0].save(fio, format='GIF', save_all=True, append_images=frames[1:],
+                   duration=int(round(1000.0 / fps)), loop=0)
+    tensor_string = fio.getvalue()
+    fio.close()
+    return Summary.Image(height=h, width=w, colorspace=c, encoded_image_string=tensor_string)
+
+
+def _make_video_moviepy(tensor, fps):
+    try:
+        import moviepy  # noqa: F401
+    except ImportError:
+        print('add_video needs package pillow or moviepy')
         return
     try:
         from moviepy import editor as mpy
@@ -313,36 +647,53 @@ def make_video(tensor, fps):
 
 
 def audio(tag, tensor, sample_rate=44100):
+    """Outputs a `Summary` protocol buffer with WAV encoded audio.
+
+    Args:
+      tag: A name for the generated summary.
+      tensor: Samples in [-1, 1]; values outside are clipped. Either a single
+        mono clip of shape `[L]` (size-1 dimensions are dropped), a clip with
+        `C` channels of shape `[C, L]`, or a batch of clips of shape `[B, C, L]`
+        which are written as `tag/audio/0`, `tag/audio/1`, ...
+      sample_rate: Sample rate in Hz.
+    Returns:
+      A `Summary` protobuf of the audio.
+    """
     tensor = make_np(tensor)
-    tensor = tensor.squeeze()
-    if abs(tensor).max() > 1:
+    if tensor.squeeze().ndim <= 1:
+        tensor = tensor.reshape(1, -1)
+    if tensor.max() > 1 or tensor.min() < -1:
         print('warning: audio amplitude out of range, auto clipped.')
         tensor = tensor.clip(-1, 1)
-    assert(tensor.ndim == 1), 'input tensor should be 1 dimensional.'
+    assert(tensor.ndim in (2, 3)), 'input tensor should be of shape [L], [C, L] or [B, C, L].'
 
-    tensor_list = [int(32767.0 * x) for x in tensor]
+    if tensor.ndim == 2:
+        return Summary(value=[Summary.Value(tag=tag, audio=_encode_wav(tensor, sample_rate))])
+    return Summary(value=[Summary.Value(tag='{}/audio/{}'.format(tag, i), audio=_encode_wav(clip, sample_rate))
+                          for i, clip in enumerate(tensor)])
+
+
+def _encode_wav(clip, sample_rate):
+    # clip has shape [C, L]. WAV frames interleave the channels, so the samples
+    # are converted to 16 bit PCM (truncating like int()) in [L, C] order.
     import io
     import wave
-    import struct
+    num_channels, length = clip.shape
+    frames = np.multiply(clip.T, 32767.0, dtype=np.float64).astype('<i2', order='C')
     fio = io.BytesIO()
     Wave_write = wave.open(fio, 'wb')
-    Wave_write.setnchannels(1)
+    Wave_write.setnchannels(num_channels)
     Wave_write.setsampwidth(2)
     Wave_write.setframerate(sample_rate)
-    tensor_enc = b''
-    for v in tensor_list:
-        tensor_enc += struct.pack('<h', v)
-
-    Wave_write.writeframes(tensor_enc)
+    Wave_write.writeframes(frames.tobytes())
     Wave_write.close()
     audio_string = fio.getvalue()
     fio.close()
-    audio = Summary.Audio(sample_rate=sample_rate,
-                          num_channels=1,
-                          length_frames=len(tensor_list),
-                          encoded_audio_string=audio_string,
-                          content_type='audio/wav')
-    return Summary(value=[Summary.Value(tag=tag, audio=audio)])
+    return Summary.Audio(sample_rate=sample_rate,
+                         num_channels=num_channels,
+                         length_frames=length,
+                         encoded_audio_string=audio_string,
+                         content_type='audio/wav')
 
 
 def custom_scalars(layout):
@@ -355,6 +706,9 @@ def custom_scalars(layout):
             tags = chart_meatadata[1]
             if chart_meatadata[0] == 'Margin':
                 assert len(tags) == 3
+                # Margin charts name exact tags, which are cleaned like the scalars' tags.
+                # Multiline charts take regular expressions and are left as is.
+                tags = [_clean_tag(tag) for tag in tags]
                 mgcc = layout_pb2.MarginChartContent(series=[layout_pb2.MarginChartContent.Series(value=tags[0],
                                                                                                   lower=tags[1],
                                                                                                   upper=tags[2])])
@@ -375,7 +729,7 @@ def custom_scalars(layout):
 
 
 def text(tag, text):
-    import json
+    tag = _clean_tag(tag)
     PluginData = [SummaryMetadata.PluginData(
         plugin_name='text', content=TextPluginData(version=0).SerializeToString())]
     smd = SummaryMetadata(plugin_data=PluginData)
@@ -0,0 +1,236 @@
+"""Encodes summaries on a worker pool, away from the training thread."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import atexit
+import logging
+import multiprocessing
+import multiprocessing.pool
+import threading
+import weakref
+
+import numpy as np
+import six
+
+from . import event_file_writer
+from .async_transfer import PendingTransfer
+from .x2num import make_np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+logger = logging.getLogger(__name__)
+
+# Values accepted by `SummaryWriter(deferred_encoding=...)`.
+ENCODING_BACKENDS = ('thread', 'process')
+
+# Encoders not closed yet, closed at interpreter exit so the summaries still in
+# the pool reach their file writers.
+_live_encoders = weakref.WeakSet()
+
+
+def _close_live_encoders():
+    for encoder in list(_live_encoders):
+        try:
+            encoder.close()
+        except Exception:
+            logger.exception('Closing a summary encoder at exit failed.')
+
+
+# Exit functions run in reverse order of registration, and the one of
+# event_file_writer was registered when it was imported above, so the encoders
+# are drained before the event writers are closed.
+atexit.register(_close_live_encoders)
+
+
+def snapshot(x):
+    """Returns a numpy copy of ``x`` which later updates of ``x`` do not affect."""
+    array = make_np(x)
+    if array is x or not array.flags.owndata:
+        array = np.array(array, copy=True)
+    return array
+
+
+def _to_shared_memory(x):
+    """Copies ``x`` into a new shared memory block.
+
+    Returns the block and the (name, shape, dtype) needed to map it again.
+    """
+    array = make_np(x)
+    shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach_shared_memory(name):
+    # Only the creating process should unlink the block, so keep the resource
+    # tracker from cleaning it up on behalf of the worker.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the block again, but with the
+        # resource tracker of the parent, which the started workers share. The
+        # parent's unlink unregisters it, unregistering it here too would make
+        # the tracker fail on that.
+        return shared_memory.SharedMemory(name=name)
+
+
+def _encode(fn, tag, tensor, kwargs):
+    return fn(tag, tensor, **kwargs)
+
+
+def _encode_transfer(fn, tag, transfer, kwargs):
+    # The host buffer is reused by later transfers once released, so the
+    # summary is encoded before giving it back.
+    try:
+        return fn(tag, transfer.wait(), **kwargs)
+    finally:
+        transfer.release()
+
+
+def _encode_shared(fn, tag, spec, kwargs):
+    # Runs in a worker process, only the encoded bytes travel back.
+    name, shape, dtype = spec
+    shm = _attach_shared_memory(name)
+    try:
+        tensor = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        summary = fn(tag, tensor, **kwargs).SerializeToString()
+        # The mapping can only be closed once no array refers to it.
+        del tensor
+        return summary
+    finally:
+        shm.close()
+
+
+def _process_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class SummaryEncoder(object):
+    """Runs summary functions (``summary.image``, ``summary.histogram``, ...) on a
+    pool of worker threads or processes and adds the resulting summaries to a
+    `FileWriter` in the order they were submitted.
+
+    With the 'process' backend the tensors are copied into shared memory blocks
+    which the workers map, so large arrays are never pickled. If the processes or
+    shared memory are not available, the 'thread' backend is used instead. The
+    workers are started with 'forkserver' (or 'spawn' where it is not available)
+    rather than forked from a process already running the writer's threads and
+    possibly CUDA, so like with any such start method the main module of the
+    program has to be guarded by ``if __name__ == '__main__':``.
+
+    A `PendingTransfer` can be submitted in place of a tensor; the copy is
+    waited for in a worker thread, never in `submit`.
+    """
+
+    def __init__(self, file_writer, backend='thread', num_workers=None, max_pending=None):
+        """
+        Args:
+          file_writer: A `FileWriter` receiving the encoded summaries.
+          backend: A string. 'thread' or 'process'.
+          num_workers: Integer. Size of the pool, defaults to the number of CPUs.
+          max_pending: Integer. Number of submitted jobs not yet written before
+            `submit` blocks. Bounds the memory held by snapshots.
+        """
+        if backend not in ENCODING_BACKENDS:
+            raise ValueError('backend should be one of {}, got {}'.format(ENCODING_BACKENDS, backend))
+        num_workers = num_workers or multiprocessing.cpu_count()
+        self._file_writer = file_writer
+        self._num_workers = num_workers
+        self._transfer_pool = None
+        self._pool = None
+        if backend == 'process':
+            try:
+                if shared_memory is None:
+                    raise ImportError('multiprocessing.shared_memory is not available')
+                self._pool = _process_context().Pool(num_workers)
+            except (ImportError, OSError) as e:
+                logger.warning('Cannot encode summaries in processes (%s), using threads instead.', e)
+                backend = 'thread'
+        if self._pool is None:
+            self._pool = multiprocessing.pool.ThreadPool(num_workers)
+        self.backend = backend
+        self._pending = six.moves.queue.Queue(max_pending or 4 * num_workers)
+        self._dispatcher = threading.Thread(target=self._dispatch)
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+        _live_encoders.add(self)
+
+    def submit(self, fn, tag, tensor, kwargs=None, global_step=None, walltime=None):
+        """Encodes ``fn(tag, tensor, **kwargs)`` in the pool and adds the resulting
+        summary with ``global_step`` and ``walltime`` once it is ready.
+
+        ``tensor`` is copied before this returns, so the caller may modify it.
+        """
+        kwargs = kwargs or {}
+        shm = None
+        if isinstance(tensor, PendingTransfer):
+            result = self._submit_transfer(fn, tag, tensor, kwargs)
+        elif self.backend == 'process':
+            array = make_np(tensor)
+            if array.nbytes and not array.dtype.hasobject:
+                shm, spec = _to_shared_memory(array)
+                result = self._pool.apply_async(_encode_shared, (fn, tag, spec, kwargs))
+            else:
+                result = self._pool.apply_async(_encode, (fn, tag, array, kwargs))
+        else:
+            result = self._pool.apply_async(_encode, (fn, tag, snapshot(tensor), kwargs))
+        self._pending.put((result, shm, global_step, walltime))
+
+    def _submit_transfer(self, fn, tag, transfer, kwargs):
+        if self.backend == 'thread':
+            return self._pool.apply_async(_encode_transfer, (fn, tag, transfer, kwargs))
+        # Wait for the copy in a thread, then encode in a process as usual.
+        if self._transfer_pool is None:
+            self._transfer_pool = multiprocessing.pool.ThreadPool(self._num_workers)
+        return self._transfer_pool.apply_async(_encode_transfer, (self._encode_in_process, tag, transfer,
+                                                                  {'fn': fn, 'kwargs': kwargs}))
+
+    def _encode_in_process(self, tag, tensor, fn, kwargs):
+        if not tensor.nbytes or tensor.dtype.hasobject:
+            return self._pool.apply(_encode, (fn, tag, tensor, kwargs))
+        shm, spec = _to_shared_memory(tensor)
+        try:
+            return self._pool.apply(_encode_shared, (fn, tag, spec, kwargs))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _dispatch(self):
+        while True:
+            item = self._pending.get()
+            try:
+                if item is None:
+                    return
+                result, shm, global_step, walltime = item
+                try:
+                    summary = result.get()
+                except Exception:
+                    logger.exception('Encoding a summary failed, it is not logged.')
+                    continue
+                finally:
+                    if shm is not None:
+                        shm.close()
+                        shm.unlink()
+                self._file_writer.add_summary(summary, global_step, walltime)
+            finally:
+                self._pending.task_done()
+
+    def flush(self):
+        """Waits until every submitted summary has been added to the file writer."""
+        self._pending.join()
+
+    def close(self):
+        """Writes the pending summaries and shuts the pool down."""
+        _live_encoders.discard(self)
+        self.flush()
+        self._pending.put(None)
+        self._dispatcher.join()
+        for pool in [self._transfer_pool, self._pool]:
+            if pool is not None:
+                pool.close()
+                pool.join()
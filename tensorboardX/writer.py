@@ -24,13 +24,17 @@ import six
 import time
 
 from .embedding import make_mat, make_sprite, make_tsv, append_pbtxt
-from .event_file_writer import EventFileWriter
+from .event_file_writer import EventFileWriter, MultiplexedEventFileWriter
 from .onnx_graph import gg
 from .pytorch_graph import graph
+from .scalar_history import HISTORY_MODES, ScalarHistory, dump_json
 from .proto import event_pb2
 from .proto import summary_pb2
 from .proto import graph_pb2
 from .summary import scalar, histogram, image, audio, text, pr_curve, pr_curve_raw, video, custom_scalars
+from .summary import default_bins, HistogramAccumulator, _add_scalar_values
+from .async_transfer import StagingBuffers, start_transfer
+from .summary_encoder import SummaryEncoder
 from .utils import figure_to_image
 from tensorboardX.proto.event_pb2 import SessionLog
 from tensorboardX.proto.event_pb2 import Event
@@ -165,7 +169,10 @@ class FileWriter(SummaryToEventTransformer):
                  max_queue=10,
                  flush_secs=120,
                  filename_suffix='',
-                 graph_def=None):
+                 graph_def=None,
+                 overflow_policy='block',
+                 max_file_bytes=None,
+                 max_file_secs=None):
         """Creates a `FileWriter` and an event file.
         On construction the summary writer creates a new event file in `logdir`.
         This event file will contain `Event` protocol buffers constructed when you
@@ -189,6 +196,14 @@ class FileWriter(SummaryToEventTransformer):
            and events to disk.
         *  `max_queue`: Maximum number of summaries or events pending to be
            written to disk before one of the 'add' calls block.
+        *  `overflow_policy`: What to do instead of blocking when `max_queue`
+           events are pending, see `EventFileWriter`.
+        *  `max_file_bytes`, `max_file_secs`: Start a new event file once the
+           current one is that large or that old, so that each file stays
+           bounded and is not modified anymore once the next one is started.
+           On S3 an event file only shows up once 5 MiB were written to it
+           or it is closed (see `record_writer.S3RecordWriter`), so set
+           `max_file_secs` to follow a long run in TensorBoard.
         Args:
           logdir: A string. Directory where event file will be written.
           graph: A `Graph` object, such as `sess.graph`.
@@ -196,9 +211,14 @@ class FileWriter(SummaryToEventTransformer):
           flush_secs: Number. How often, in seconds, to flush the
             pending events and summaries to disk.
           graph_def: DEPRECATED: Use the `graph` argument instead.
+          overflow_policy: A string. One of 'block', 'drop_newest', 'drop_oldest'
+            or 'coalesce'.
+          max_file_bytes: Integer. Size from which a new event file is started.
+          max_file_secs: Number. Age in seconds from which a new event file is
+            started.
         """
         event_writer = EventFileWriter(
-            logdir, max_queue, flush_secs, filename_suffix)
+            logdir, max_queue, flush_secs, filename_suffix, overflow_policy, max_file_bytes, max_file_secs)
         super(FileWriter, self).__init__(event_writer, graph, graph_def)
 
     def get_logdir(self):
@@ -212,6 +232,10 @@ class FileWriter(SummaryToEventTransformer):
         """
         self.event_writer.add_event(event)
 
+    def get_stats(self):
+        """Returns counters about the background writes, see `EventFileWriter.get_stats`."""
+        return self.event_writer.get_stats()
+
     def flush(self):
         """Flushes the event file to disk.
         Call this method to make sure that all pending events have been written to
@@ -234,6 +258,11 @@ class FileWriter(SummaryToEventTransformer):
         self.event_writer.reopen()
 
 
+# FileWriter arguments which also apply to the runs of add_scalars.
+_SUB_RUN_OPTIONS = ('max_queue', 'flush_secs', 'filename_suffix', 'overflow_policy', 'max_file_bytes',
+                    'max_file_secs')
+
+
 class SummaryWriter(object):
     """Writes `Summary` directly to event files.
     The `SummaryWriter` class provides a high-level api to create an event file in a
@@ -243,7 +272,8 @@ class SummaryWriter(object):
     training.
     """
 
-    def __init__(self, log_dir=None, comment='', **kwargs):
+    def __init__(self, log_dir=None, comment='', deferred_encoding=None, encoding_workers=None, async_transfer=False,
+                 scalar_history_capacity=None, scalar_history_mode='ring', **kwargs):
         """
         Args:
             log_dir (string): save location, default is: runs/**CURRENT_DATETIME_HOSTNAME**, which changes after each
@@ -256,6 +286,27 @@ class SummaryWriter(object):
               Note that the resumed experiment and crashed experiment should have the same ``log_dir``.
             filename_suffix (string):
               Every event file's name is suffixed with suffix. example: ``SummaryWriter(filename_suffix='.123')``
+            overflow_policy (string): What ``add_*`` calls do when ``max_queue`` events are waiting to be written.
+              ``'block'`` (default) waits, ``'drop_newest'`` and ``'drop_oldest'`` drop an event, ``'coalesce'`` keeps
+              only the latest pending scalar of each tag. Dropped events are counted in the scalar
+              ``tensorboardX/dropped_events``.
+            max_file_bytes (int): Start a new event file once the current one holds this many bytes.
+            max_file_secs (float): Start a new event file once the current one is this many seconds old. Events
+              logged to ``s3://`` only become visible once 5 MiB were flushed or their file is closed, use
+              ``max_file_secs`` to see a long run in TensorBoard as it goes.
+            deferred_encoding (string): If set to ``'thread'`` or ``'process'``, ``add_image``, ``add_histogram``,
+              ``add_video`` and ``add_audio`` only copy their input and leave the encoding to a pool of worker
+              threads or processes. The summaries are written in the order of the calls. Processes receive the
+              data through shared memory; where that is not available threads are used.
+            encoding_workers (int): Number of encoding workers, defaults to the number of CPUs.
+            async_transfer (bool): Copy GPU tensors given to ``add_scalar``, ``add_histogram``, ``add_image``,
+              ``add_video`` and ``add_audio`` to reused pinned host buffers without waiting for the device; the
+              encoding workers wait for the copy instead. Implies ``deferred_encoding='thread'`` unless another
+              backend is given.
+            scalar_history_capacity (int): Number of values of each tag of ``add_scalars`` kept in memory for
+              ``export_scalars_to_json``, unbounded by default.
+            scalar_history_mode (string): Which values are kept once ``scalar_history_capacity`` is reached:
+              ``'ring'`` (default) keeps the most recent ones, ``'reservoir'`` a uniform sample of all of them.
             kwargs: extra keyword arguments for FileWriter (e.g. 'flush_secs'
               controls how often to flush pending events). For more arguments
               please refer to docs for 'tf.summary.FileWriter'.
@@ -278,19 +329,30 @@ class SummaryWriter(object):
         else:
             self.file_writer = FileWriter(logdir=log_dir, **kwargs)
 
-        # Create default bins for histograms, see generate_testdata.py in tensorflow/tensorboard
-        v = 1E-12
-        buckets = []
-        neg_buckets = []
-        while v < 1E20:
-            buckets.append(v)
-            neg_buckets.append(-v)
-            v *= 1.1
-        self.default_bins = neg_buckets[::-1] + [0] + buckets
+        self._encoder = None
+        self._staging = None
+        if async_transfer:
+            self._staging = StagingBuffers()
+            deferred_encoding = deferred_encoding or 'thread'
+        if deferred_encoding is not None:
+            self._encoder = SummaryEncoder(self.file_writer, deferred_encoding, encoding_workers)
+
+        # Default bins for histograms, shared by all writers
+        self.default_bins = default_bins()
 
         self.all_writers = {self.file_writer.get_logdir(): self.file_writer}
-        # {writer_id : [[timestamp, step, value],...],...}
+        # The runs of add_scalars share the threads and files of one writer.
+        self._sub_runs = None
+        self._sub_run_writers = {}
+        # They queue, drop and rotate events like the main one.
+        self._sub_run_options = {key: kwargs[key] for key in _SUB_RUN_OPTIONS if key in kwargs}
+        # {writer_id : ScalarHistory of [timestamp, step, value] rows}
         self.scalar_dict = {}
+        if scalar_history_mode not in HISTORY_MODES:
+            raise ValueError('scalar_history_mode should be one of {}, got {}'.format(
+                HISTORY_MODES, scalar_history_mode))
+        self._scalar_history_capacity = scalar_history_capacity
+        self._scalar_history_mode = scalar_history_mode
 
         # TODO (ml7): Remove try-except when PyTorch 1.0 merges PyTorch and Caffe2
         try:
@@ -303,13 +365,13 @@ class SummaryWriter(object):
     def __append_to_scalar_dict(self, tag, scalar_value, global_step,
                                 timestamp):
         """This adds an entry to the self.scalar_dict datastructure with format
-        {writer_id : [[timestamp, step, value], ...], ...}.
+        {writer_id : ScalarHistory of [timestamp, step, value] rows}.
         """
-        from .x2num import make_np
-        if tag not in self.scalar_dict.keys():
-            self.scalar_dict[tag] = []
-        self.scalar_dict[tag].append(
-            [timestamp, global_step, float(make_np(scalar_value))])
+        from .x2num import make_scalar
+        history = self.scalar_dict.get(tag)
+        if history is None:
+            history = self.scalar_dict[tag] = ScalarHistory(self._scalar_history_capacity, self._scalar_history_mode)
+        history.append(timestamp, global_step, make_scalar(scalar_value))
 
     def _check_caffe2(self, item):
         """
@@ -327,6 +389,24 @@ class SummaryWriter(object):
         # TODO (ml7): Remove caffe2_enabled check when PyTorch 1.0 merges PyTorch and Caffe2
         return self.caffe2_enabled and isinstance(item, six.string_types)
 
+    def _add_encoded(self, fn, tag, tensor, kwargs, global_step, walltime):
+        """Adds the summary ``fn(tag, tensor, **kwargs)``, encoded in the
+        background when deferred encoding is enabled.
+        """
+        if self._encoder is None:
+            self.file_writer.add_summary(fn(tag, tensor, **kwargs), global_step, walltime)
+            return
+        walltime = time.time() if walltime is None else walltime
+        self._encoder.submit(fn, tag, self._start_transfer(tensor) or tensor, kwargs, global_step, walltime)
+
+    def _start_transfer(self, tensor):
+        """Returns a `PendingTransfer` copying ``tensor`` to the host if ``async_transfer`` is enabled
+        and ``tensor`` is on a device, else None.
+        """
+        if self._staging is None:
+            return None
+        return start_transfer(tensor, self._staging)
+
     def add_scalar(self, tag, scalar_value, global_step=None, walltime=None):
         """Add scalar data to summary.
 
@@ -338,13 +418,45 @@ class SummaryWriter(object):
         """
         if self._check_caffe2(scalar_value):
             scalar_value = workspace.FetchBlob(scalar_value)
+        transfer = self._start_transfer(scalar_value)
+        if transfer is not None:
+            self._add_encoded(scalar, tag, transfer, {}, global_step, walltime)
+            return
         self.file_writer.add_summary(
             scalar(tag, scalar_value), global_step, walltime)
 
+    def add_scalars_batch(self, tag_scalar_dict, global_step=None, walltime=None):
+        """Adds the scalars of many tags for one step as a single event.
+
+        Unlike ``add_scalars``, each tag is a plot of its own as with ``add_scalar``, the values are not
+        kept in memory and no extra event files are created. The tag lists are cleaned once and cached.
+
+        Args:
+            tag_scalar_dict (dict or tuple): Key-value pair storing the tag and corresponding values, or a
+              ``(tags, values)`` pair where ``values`` is a sequence or a tensor with one value per tag
+            global_step (int): Global step value to record
+            walltime (float): Optional override default walltime (time.time()) of event
+
+        Examples::
+
+            writer.add_scalars_batch({'loss': loss, 'accuracy': accuracy}, i)
+            writer.add_scalars_batch((metric_names, metric_tensor), i)
+        """
+        if isinstance(tag_scalar_dict, dict):
+            tags, values = list(tag_scalar_dict.keys()), list(tag_scalar_dict.values())
+        else:
+            tags, values = tag_scalar_dict
+        event = Event()
+        _add_scalar_values(event.summary, tags, values)
+        self.file_writer._add_event(event, global_step, walltime)
+
     def add_scalars(self, main_tag, tag_scalar_dict, global_step=None, walltime=None):
         """Adds many scalar data to summary.
 
-        Note that this function also keeps logged scalars in memory. In extreme case it explodes your RAM.
+        Note that this function also keeps logged scalars in memory for ``export_scalars_to_json``, about
+        20 bytes per value; use ``scalar_history_capacity`` to bound it.
+        Each tag is written to its own run directory; all these runs share one background thread and a
+        bounded number of open files.
 
         Args:
             main_tag (string): The parent name for the tags
@@ -362,13 +474,15 @@ class SummaryWriter(object):
         """
         walltime = time.time() if walltime is None else walltime
         fw_logdir = self.file_writer.get_logdir()
+        if self._sub_runs is None:
+            self._sub_runs = MultiplexedEventFileWriter(**self._sub_run_options)
         for tag, scalar_value in tag_scalar_dict.items():
             fw_tag = fw_logdir + "/" + main_tag + "/" + tag
-            if fw_tag in self.all_writers.keys():
-                fw = self.all_writers[fw_tag]
-            else:
-                fw = FileWriter(logdir=fw_tag)
-                self.all_writers[fw_tag] = fw
+            fw = self._sub_run_writers.get(fw_tag)
+            if fw is None:
+                # Each tag is a run of its own, written in its own directory.
+                fw = SummaryToEventTransformer(self._sub_runs.writer(fw_tag))
+                self._sub_run_writers[fw_tag] = fw
             if self._check_caffe2(scalar_value):
                 scalar_value = workspace.FetchBlob(scalar_value)
             fw.add_summary(scalar(main_tag, scalar_value),
@@ -384,7 +498,7 @@ class SummaryWriter(object):
         The scalars saved by ``add_scalars()`` will be flushed after export.
         """
         with open(path, "w") as f:
-            json.dump(self.scalar_dict, f)
+            dump_json(self.scalar_dict, f)
         self.scalar_dict = {}
 
     def add_histogram(self, tag, values, global_step=None, bins='tensorflow', walltime=None):
@@ -392,18 +506,24 @@ class SummaryWriter(object):
 
         Args:
             tag (string): Data identifier
-            values (torch.Tensor, numpy.array, or string/blobname): Values to build histogram
+            values (torch.Tensor, numpy.array, string/blobname or HistogramAccumulator): Values to build histogram.
+              The histogram of a HistogramAccumulator is logged as is and ``bins`` is ignored.
             global_step (int): Global step value to record
             bins (string): one of {'tensorflow','auto', 'fd', ...}, this determines how the bins are made. You can find
               other options in: https://docs.scipy.org/doc/numpy/reference/generated/numpy.histogram.html
             walltime (float): Optional override default walltime (time.time()) of event
         """
+        if isinstance(values, HistogramAccumulator):
+            # Already reduced to counts, nothing left to encode in the background.
+            self.file_writer.add_summary(histogram(tag, values, bins), global_step, walltime)
+            return
         if self._check_caffe2(values):
             values = workspace.FetchBlob(values)
-        if isinstance(bins, six.string_types) and bins == 'tensorflow':
+        if isinstance(bins, six.string_types) and bins == 'tensorflow' and self.default_bins is not default_bins():
+            # Only a replaced default is passed as edges: the name keeps the fast
+            # path of the default buckets, also once pickled to an encoding process.
             bins = self.default_bins
-        self.file_writer.add_summary(
-            histogram(tag, values, bins), global_step, walltime)
+        self._add_encoded(histogram, tag, values, {'bins': bins}, global_step, walltime)
 
     def add_image(self, tag, img_tensor, global_step=None, walltime=None):
         """Add image data to summary.
@@ -420,8 +540,7 @@ class SummaryWriter(object):
         """
         if self._check_caffe2(img_tensor):
             img_tensor = workspace.FetchBlob(img_tensor)
-        self.file_writer.add_summary(
-            image(tag, img_tensor), global_step, walltime)
+        self._add_encoded(image, tag, img_tensor, {}, global_step, walltime)
 
     def add_image_with_boxes(self, tag, img_tensor, box_tensor, global_step=None,
                              walltime=None, **kwargs):
@@ -456,10 +575,11 @@ class SummaryWriter(object):
         self.add_image(tag, figure_to_image(
             figure, close), global_step, walltime)
 
-    def add_video(self, tag, vid_tensor, global_step=None, fps=4, walltime=None):
+    def add_video(self, tag, vid_tensor, global_step=None, fps=4, walltime=None, shared_palette=False,
+                  grid_shape=None):
         """Add video data to summary.
 
-        Note that this requires the ``moviepy`` package.
+        Note that this requires the ``pillow`` package (or ``moviepy``).
 
         Args:
             tag (string): Data identifier
@@ -467,11 +587,15 @@ class SummaryWriter(object):
             global_step (int): Global step value to record
             fps (float or int): Frames per second
             walltime (float): Optional override default walltime (time.time()) of event
+            shared_palette (bool): Quantize all frames to the palette of the first frame
+              instead of one palette per frame. Faster, and smaller when colors change little.
+            grid_shape (tuple): ``(rows, cols)`` used to tile the batch of videos, either may be None.
+              Defaults to a near-square grid sized for the batch padded to a power of two.
         Shape:
             vid_tensor: :math:`(B, C, T, H, W)`.
         """
-        self.file_writer.add_summary(
-            video(tag, vid_tensor, fps), global_step, walltime)
+        self._add_encoded(video, tag, vid_tensor, {'fps': fps, 'shared_palette': shared_palette,
+                                                   'grid_shape': grid_shape}, global_step, walltime)
 
     def add_audio(self, tag, snd_tensor, global_step=None, sample_rate=44100, walltime=None):
         """Add audio data to summary.
@@ -483,12 +607,13 @@ class SummaryWriter(object):
             sample_rate (int): sample rate in Hz
             walltime (float): Optional override default walltime (time.time()) of event
         Shape:
-            snd_tensor: :math:`(1, L)`. The values should lie between [-1, 1].
+            snd_tensor: :math:`(1, L)` for a mono clip, :math:`(C, L)` for a clip with C channels or
+            :math:`(B, C, L)` for a batch of clips, logged as ``tag/audio/0``, ``tag/audio/1``, ...
+            The values should lie between [-1, 1].
         """
         if self._check_caffe2(snd_tensor):
             snd_tensor = workspace.FetchBlob(snd_tensor)
-        self.file_writer.add_summary(
-            audio(tag, snd_tensor, sample_rate=sample_rate), global_step, walltime)
+        self._add_encoded(audio, tag, snd_tensor, {'sample_rate': sample_rate}, global_step, walltime)
 
     def add_text(self, tag, text_string, global_step=None, walltime=None):
         """Add text data to summary.
@@ -740,14 +865,29 @@ class SummaryWriter(object):
         """
         self.file_writer.add_summary(custom_scalars(layout))
 
+    def flush(self):
+        """Writes the summaries still being encoded and flushes the event files to disk."""
+        if self.file_writer is None:
+            return
+        if self._encoder is not None:
+            self._encoder.flush()
+        for writer in self.all_writers.values():
+            writer.flush()
+        if self._sub_runs is not None:
+            self._sub_runs.flush()
+
     def close(self):
         if self.file_writer is None:
             return  # ignore double close
+        if self._encoder is not None:
+            self._encoder.close()
         self.file_writer.flush()
         self.file_writer.close()
         for path, writer in self.all_writers.items():
             writer.flush()
             writer.close()
+        if self._sub_runs is not None:
+            self._sub_runs.close()
         self.file_writer = self.all_writers = None
 
     def __enter__(self):
@@ -3,31 +3,86 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numbers
 import numpy as np
 import six
 
 
 def make_np(x, modality=None):
-    if isinstance(x, np.ndarray):
-        return prepare_numpy(x, modality)
-    if isinstance(x, six.string_types):  # Caffe2 will pass name of blob(s) to fetch
-        return prepare_caffe2(x, modality)
-    if np.isscalar(x):
-        return np.array([x])
-    if 'torch' in str(type(x)):
-        return prepare_pytorch(x, modality)
-    if 'chainer' in str(type(x)):
-        return prepare_chainer(x, modality)
-    if 'mxnet' in str(type(x)):
-        return prepare_mxnet(x, modality)
+    converter = _dispatch_cache.get(type(x))
+    if converter is None:
+        converter = _find_converter(type(x))
+    return converter(x, modality)
+
+
+def make_scalar(x):
+    """Returns the single value of ``x`` (a Python or numpy scalar, or a
+    tensor with one element) as a Python float.
+
+    Python numbers, numpy scalars and 0-d tensors are converted directly,
+    without building a one-element array.
+    """
+    if isinstance(x, _NUMBER_TYPES):
+        return float(x)
+    if getattr(x, 'ndim', None) == 0:
+        try:
+            return float(x)
+        except TypeError:
+            pass
+    x = make_np(x).squeeze()
+    assert x.ndim == 0, 'scalar should be 0D'
+    return float(x)
+
+
+def register_converter(cls, fn):
+    """Registers ``fn(x, modality)`` to convert instances of ``cls`` (and its
+    subclasses) to numpy arrays in `make_np`.
+
+    ``modality`` is None, ``'IMG'`` or ``'VID'``; converters usually return
+    ``prepare_numpy(array, modality)`` to get the image and video layouts.
+    A converter registered for a class takes precedence over the built-in
+    ones.
+    """
+    _converters[cls] = fn
+    _dispatch_cache.clear()
+
+
+def _find_converter(cls):
+    # The first registered class in the MRO wins, then numpy scalars and
+    # Python numbers, then the frameworks recognised by their type name.
+    # The result is cached per concrete type.
+    converter = None
+    for base in cls.__mro__:
+        if base in _converters:
+            converter = _converters[base]
+            break
+    if converter is None:
+        name = str(cls)
+        if issubclass(cls, _NUMBER_TYPES) or cls in np.ScalarType:
+            converter = _prepare_scalar
+        elif 'torch' in name:
+            converter = prepare_pytorch
+        elif 'chainer' in name:
+            converter = prepare_chainer
+        elif 'mxnet' in name:
+            converter = prepare_mxnet
+        else:
+            converter = _not_implemented
+    _dispatch_cache[cls] = converter
+    return converter
+
+
+def _prepare_scalar(x, modality):
+    return np.array([x])
+
+
+def _not_implemented(x, modality):
     raise NotImplementedError(
         'Got {}, but expected numpy array or torch tensor.'.format(type(x)))
 
 
 def prepare_numpy(x, modality):
     if modality == 'IMG':
-        if x.dtype == np.uint8:
-            x = x.astype(np.float32) / 255.0
         x = _prepare_image(x)
     if modality == 'VID':
         x = _prepare_video(x)
@@ -79,67 +134,89 @@ def prepare_chainer(x, modality):
     return x
 
 
+_NUMBER_TYPES = (numbers.Number, np.generic)
+# Classes registered with register_converter, and built-in ones.
+_converters = {np.ndarray: prepare_numpy}
+for _string_type in six.string_types:  # Caffe2 will pass name of blob(s) to fetch
+    _converters[_string_type] = prepare_caffe2
+# Converter found for each concrete type seen by make_np.
+_dispatch_cache = {}
+
+
 def make_grid(I, ncols=8):
+    """Tiles a NCHW batch into a CxHxW grid of the same dtype.
+
+    The canvas is laid out as HWC so that `_prepare_image` gets a contiguous
+    image back from the transposed result; the tiles are copied into it with
+    one strided assignment per (full or last) row of images.
+    """
     assert isinstance(
         I, np.ndarray), 'plugin error, should pass numpy array here'
-    assert I.ndim == 4 and I.shape[1] == 3
-    nimg = I.shape[0]
-    H = I.shape[2]
-    W = I.shape[3]
+    assert I.ndim == 4
+    nimg, C, H, W = I.shape
     ncols = min(nimg, ncols)
     nrows = int(np.ceil(float(nimg) / ncols))
-    canvas = np.zeros((3, H * nrows, W * ncols))
-    i = 0
-    for y in range(nrows):
-        for x in range(ncols):
-            if i >= nimg:
-                break
-            canvas[:, y * H:(y + 1) * H, x * W:(x + 1) * W] = I[i]
-            i = i + 1
-    return canvas
+    canvas = np.zeros((H * nrows, W * ncols, C), dtype=I.dtype)
+    # tiles[r, :, c, :, :] is the image at row r and column c
+    tiles = canvas.reshape(nrows, H, ncols, W, C)
+    full_rows = nimg // ncols
+    if full_rows:
+        tiles[:full_rows] = I[:full_rows * ncols].reshape(full_rows, ncols, C, H, W).transpose(0, 3, 1, 4, 2)
+    if full_rows < nrows:
+        tiles[full_rows, :, :nimg - full_rows * ncols] = I[full_rows * ncols:].transpose(2, 0, 3, 1)
+    return canvas.transpose(2, 0, 1)
 
 
 def _prepare_image(I):
-    # convert [N]CHW image to HWC
+    # convert [N]CHW image to HWC, keeping the dtype. Grayscale images are
+    # broadcast to 3 channels without copying.
     assert isinstance(
         I, np.ndarray), 'plugin error, should pass numpy array here'
     assert I.ndim == 2 or I.ndim == 3 or I.ndim == 4
     if I.ndim == 4:  # NCHW
-        if I.shape[1] == 1:  # N1HW
-            I = np.concatenate((I, I, I), 1)  # N3HW
-        assert I.shape[1] == 3
-        I = make_grid(I)  # 3xHxW
-    if I.ndim == 3 and I.shape[0] == 1:  # 1xHxW
-        I = np.concatenate((I, I, I), 0)  # 3xHxW
+        assert I.shape[1] == 1 or I.shape[1] == 3
+        I = make_grid(I)  # CxHxW
     if I.ndim == 2:  # HxW
         I = np.expand_dims(I, 0)  # 1xHxW
-        I = np.concatenate((I, I, I), 0)  # 3xHxW
     I = I.transpose(1, 2, 0)
+    if I.shape[2] == 1:
+        I = np.broadcast_to(I, I.shape[:2] + (3,))
 
     return I
 
 
-def _prepare_video(V):
-    b, c, t, h, w = V.shape
-
-    if V.dtype == np.uint8:
-        V = np.float32(V) / 255.
+def _prepare_video(V, grid_shape=None):
+    """Tiles a BxCxTxHxW batch of videos into one TxHxWxC video of the same dtype.
 
-    def is_power2(num):
-        return num != 0 and ((num & (num - 1)) == 0)
-
-    # pad to nearest power of 2, all at once
-    if not is_power2(V.shape[0]):
-        len_addition = int(2**V.shape[0].bit_length() - V.shape[0])
-        V = np.concatenate(
-            (V, np.zeros(shape=(len_addition, c, t, h, w))), axis=0)
-
-    b = V.shape[0]
-    n_rows = 2**((b.bit_length() - 1) // 2)
-    n_cols = b // n_rows
-
-    V = np.reshape(V, newshape=(n_rows, n_cols, c, t, h, w))
-    V = np.transpose(V, axes=(3, 0, 4, 1, 5, 2))
-    V = np.reshape(V, newshape=(t, n_rows * h, n_cols * w, c))
+    Args:
+        V: The batch of videos.
+        grid_shape: ``(n_rows, n_cols)`` of the grid; either may be None to fit
+          the batch. By default the batch is laid out as if it was padded to a
+          power of two, with at most as many rows as columns.
+    """
+    b, c, t, h, w = V.shape
 
-    return V
+    if grid_shape is None:
+        padded = 1 << (b - 1).bit_length()  # nearest power of 2
+        n_rows = 2**((padded.bit_length() - 1) // 2)
+        n_cols = padded // n_rows
+    else:
+        n_rows, n_cols = grid_shape
+        if n_rows is None:
+            n_rows = -(-b // n_cols)
+        if n_cols is None:
+            n_cols = -(-b // n_rows)
+        if n_rows * n_cols < b:
+            raise ValueError('A {}x{} grid cannot hold {} videos.'.format(n_rows, n_cols, b))
+
+    # The empty cells of the grid stay zero, no padded copy of the batch is made.
+    out = np.zeros((t, n_rows * h, n_cols * w, c), dtype=V.dtype)
+    # tiles[:, r, :, col, :, :] is the video at row r and column col
+    tiles = out.reshape(t, n_rows, h, n_cols, w, c)
+    full_rows = b // n_cols
+    if full_rows:
+        tiles[:, :full_rows] = V[:full_rows * n_cols].reshape(full_rows, n_cols, c, t, h, w).transpose(3, 0, 4, 1, 5, 2)
+    if full_rows * n_cols < b:
+        tiles[:, full_rows, :, :b - full_rows * n_cols] = V[full_rows * n_cols:].transpose(2, 3, 0, 4, 1)
+
+    return out
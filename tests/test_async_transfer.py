@@ -0,0 +1,93 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from tensorboardX import SummaryWriter, async_transfer
+from tests.test_event_file_writer import read_events
+
+
+class DeviceTensor(object):
+    """Stands in for a GPU tensor whose value is only on the host once `device` is set."""
+    device = threading.Event()
+
+    def __init__(self, data):
+        self.data = np.asarray(data)
+
+
+class CopyEvent(object):
+    def __init__(self, host, source):
+        self._host = host
+        self._source = source
+
+    def query(self):
+        return DeviceTensor.device.is_set()
+
+    def synchronize(self):
+        DeviceTensor.device.wait()
+        if self._source is not None:
+            np.copyto(self._host, self._source)
+            self._source = None
+
+
+def transfer_device_tensor(x, staging):
+    key = (x.data.shape, x.data.dtype.str)
+    host = staging.acquire(key, lambda: np.empty(x.data.shape, x.data.dtype))
+    return async_transfer.PendingTransfer(host, CopyEvent(host, x.data.copy()), lambda: staging.release(key, host))
+
+
+class AsyncTransferTest(unittest.TestCase):
+    def setUp(self):
+        self.logdir = tempfile.mkdtemp()
+        DeviceTensor.device.clear()
+        async_transfer.register_transfer(DeviceTensor, transfer_device_tensor)
+
+    def tearDown(self):
+        del async_transfer._transfers[DeviceTensor]
+        async_transfer._dispatch_cache.clear()
+        DeviceTensor.device.set()
+        shutil.rmtree(self.logdir)
+
+    def test_add_does_not_wait_for_device(self):
+        writer = SummaryWriter(self.logdir, async_transfer=True)
+
+        def log():
+            writer.add_histogram('histogram', DeviceTensor(np.arange(100.0)), 1)
+            writer.add_scalar('scalar', DeviceTensor(2.5), 1)
+            writer.add_scalar('host', 1.5, 1)
+        thread = threading.Thread(target=log)
+        thread.start()
+        thread.join(10)
+        assert not thread.is_alive()
+
+        DeviceTensor.device.set()
+        writer.close()
+        values = {event.summary.value[0].tag: event.summary.value[0]
+                  for event in read_events(self.logdir) if event.HasField('summary')}
+        assert values['histogram'].histo.num == 100 and values['histogram'].histo.max == 99
+        assert values['scalar'].simple_value == 2.5
+        assert values['host'].simple_value == 1.5
+
+    def test_staging_buffers_are_reused(self):
+        DeviceTensor.device.set()
+        with SummaryWriter(self.logdir, async_transfer=True) as writer:
+            for step in range(5):
+                writer.add_histogram('histogram', DeviceTensor(np.full(10, step)), step)
+                writer.flush()
+            assert writer._staging.allocated == 1
+        histograms = [event.summary.value[0].histo for event in read_events(self.logdir) if event.HasField('summary')]
+        assert [histo.max for histo in histograms] == list(range(5))
+
+    def test_host_tensors_are_not_transferred(self):
+        assert async_transfer.start_transfer(np.zeros(3), async_transfer.StagingBuffers()) is None
+
+
+if __name__ == '__main__':
+    unittest.main()
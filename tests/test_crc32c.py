@@ -0,0 +1,67 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import unittest
+
+from tensorboardX import crc32c
+
+
+def reference_crc32c(data):
+    crc = 0xffffffff
+    for b in bytearray(data):
+        crc = crc32c.CRC_TABLE[(crc ^ b) & 0xff] ^ (crc >> 8)
+    return crc ^ 0xffffffff
+
+
+class CRC32CTest(unittest.TestCase):
+    def setUp(self):
+        self.default_backend = crc32c.get_backend()
+
+    def tearDown(self):
+        crc32c.set_backend(self.default_backend)
+
+    def test_known_value(self):
+        for backend in crc32c.available_backends():
+            crc32c.set_backend(backend)
+            assert crc32c.crc32c(b'123456789') == 0xe3069283
+            assert crc32c.crc32c(b'') == 0
+
+    def test_slicing_by_8(self):
+        crc32c.set_backend('python')
+        for size in [31, 32, 33, 40, 1000, 65536 + 5]:
+            data = os.urandom(size)
+            assert crc32c.crc32c(data) == reference_crc32c(data), size
+            assert crc32c.crc32c(list(bytearray(data))) == reference_crc32c(data), size
+
+    def test_backends_agree(self):
+        sizes = [1, 7, 8, 9, 4095, 4096, 4097, 65536 + 3, 1 << 20]
+        for size in sizes:
+            data = os.urandom(size)
+            crc32c.set_backend('python')
+            expected = crc32c.crc32c(data)
+            for backend in crc32c.available_backends():
+                crc32c.set_backend(backend)
+                assert crc32c.crc32c(data) == expected, (backend, size)
+                assert crc32c.crc32c(bytearray(data)) == expected, (backend, size)
+
+    def test_streaming(self):
+        data = os.urandom(100003)
+        expected = crc32c.crc32c(data)
+        for backend in crc32c.available_backends():
+            crc32c.set_backend(backend)
+            crc = crc32c.CRC_INIT
+            for start in range(0, len(data), 9999):
+                crc = crc32c.crc_update(crc, data[start:start + 9999])
+            assert crc32c.crc_finalize(crc) == expected, backend
+
+    def test_extension_is_not_this_module(self):
+        # Without absolute imports, Python 2 would find tensorboardX/crc32c.py itself.
+        for ext in (crc32c._crc32c_ext, crc32c._google_crc32c_ext):
+            assert ext is None or not ext.__name__.startswith('tensorboardX')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            crc32c.set_backend('no_such_backend')
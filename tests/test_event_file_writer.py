@@ -0,0 +1,228 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import glob
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import six
+
+from tensorboardX.event_file_writer import DROPPED_EVENTS_TAG, EventFileWriter, EventsWriter, MultiplexedEventFileWriter
+from tensorboardX.event_file_writer import _EventLoggerThread, _EventQueue
+from tensorboardX.proto.event_pb2 import Event
+from tensorboardX.summary import scalar
+from tests.test_record_writer import read_records, run_script
+
+
+def read_events(logdir):
+    events = []
+    for path in sorted(glob.glob(os.path.join(logdir, 'events.out.tfevents.*'))):
+        for record in read_records(path):
+            event = Event()
+            event.ParseFromString(record)
+            events.append(event)
+    return events
+
+
+class RecordingEventsWriter(object):
+    def __init__(self):
+        self.batches = []
+        self.flushes = 0
+
+    def write_events(self, events):
+        self.batches.append(list(events))
+
+    def flush(self):
+        self.flushes += 1
+
+
+class EventFileWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.logdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.logdir)
+
+    def test_events_are_written_in_order(self):
+        writer = EventFileWriter(self.logdir, max_queue=100)
+        for step in range(250):
+            writer.add_event(Event(step=step, summary=scalar('loss', step)))
+        writer.close()
+        events = read_events(self.logdir)
+        assert not events[0].HasField('summary')
+        assert [event.step for event in events[1:]] == list(range(250))
+        stats = writer.get_stats()
+        assert stats['events'] == 250
+        assert stats['batches'] <= 250
+
+    def test_events_are_written_at_exit_without_close(self):
+        script = (
+            'import sys\n'
+            'from tensorboardX import SummaryWriter\n'
+            'writer = SummaryWriter(sys.argv[1])\n'
+            'for step in range(20):\n'
+            '    writer.add_scalar("loss", step, step)\n'
+            'writer.add_scalars("metrics", {"a": 1.0}, 0)\n')
+        run_script(script, self.logdir)
+        assert [event.step for event in read_events(self.logdir)[1:]] == list(range(20))
+        assert len(read_events(os.path.join(self.logdir, 'metrics', 'a'))) == 2
+
+    def test_rotation_by_size(self):
+        writer = EventFileWriter(self.logdir, max_queue=1, max_file_bytes=300)
+        for step in range(50):
+            writer.add_event(Event(step=step, summary=scalar('loss', step)))
+        writer.close()
+        paths = sorted(glob.glob(os.path.join(self.logdir, 'events.out.tfevents.*')))
+        assert len(paths) > 5
+        timestamps = [int(os.path.basename(path).split('.')[3]) for path in paths]
+        assert timestamps == sorted(set(timestamps))
+        steps = []
+        for path in paths:
+            assert os.path.getsize(path) < 400
+            records = read_records(path)
+            header = Event.FromString(records[0])
+            assert header.file_version == 'brain.Event:2'
+            assert header.step == (steps[-1] if steps else 0)
+            steps += [Event.FromString(record).step for record in records[1:]]
+        assert steps == list(range(50))
+
+    def test_rotation_by_age(self):
+        writer = EventsWriter(os.path.join(self.logdir, 'events'), max_file_secs=0)
+        for step in range(3):
+            writer.write_event(Event(step=step, summary=scalar('loss', step)))
+        writer.close()
+        assert len(glob.glob(os.path.join(self.logdir, 'events.out.tfevents.*'))) == 3
+        assert [event.step for event in read_events(self.logdir) if event.HasField('summary')] == [0, 1, 2]
+
+    def test_file_timestamps_of_other_runs_do_not_drift(self):
+        start = int(time.time())
+        for run in range(300):
+            EventsWriter(os.path.join(self.logdir, 'run{}'.format(run))).close()
+        timestamps = [int(os.path.basename(path).split('.')[3])
+                      for path in glob.glob(os.path.join(self.logdir, 'run*.out.tfevents.*'))]
+        assert len(timestamps) == 300
+        assert start <= min(timestamps) and max(timestamps) <= time.time()
+
+    def test_logger_thread_drains_queue_in_one_batch(self):
+        queue = six.moves.queue.Queue()
+        for step in range(20):
+            queue.put(Event(step=step))
+        ev_writer = RecordingEventsWriter()
+        worker = _EventLoggerThread(queue, ev_writer, flush_secs=1000)
+        worker.start()
+        worker.stop()
+        assert [len(batch) for batch in ev_writer.batches] == [20]
+        assert worker.stats['max_batch_size'] == 20
+        assert worker.stats['batches'] == 1
+
+    def test_failed_write_does_not_stop_the_logger_thread(self):
+        writer = EventFileWriter(self.logdir)
+        write_events = writer._ev_writer.write_events
+
+        def fail_once(events):
+            writer._ev_writer.write_events = write_events
+            raise IOError('disk full')
+        writer._ev_writer.write_events = fail_once
+        writer.add_event(Event(step=0))
+        writer.flush()
+        assert writer._worker.is_alive()
+        writer.add_event(Event(step=1))
+        writer.close()
+        assert [event.step for event in read_events(self.logdir)][-1] == 1
+
+    def test_close_returns_when_the_logger_thread_is_gone(self):
+        writer = EventFileWriter(self.logdir, max_queue=1)
+        writer._worker.stop()
+        writer.add_event(Event(step=0))
+        writer.close()
+
+
+class EventQueueTest(unittest.TestCase):
+    def steps(self, queue):
+        return [event.step for event in queue.queue]
+
+    def test_drop_newest(self):
+        queue = _EventQueue(2, 'drop_newest')
+        for step in range(3):
+            queue.put_event(Event(step=step))
+        assert self.steps(queue) == [0, 1]
+        assert queue.dropped == 1
+
+    def test_drop_oldest(self):
+        queue = _EventQueue(2, 'drop_oldest')
+        for step in range(3):
+            queue.put_event(Event(step=step))
+        assert self.steps(queue) == [1, 2]
+        assert queue.dropped == 1
+        assert queue.unfinished_tasks == 2
+
+    def test_coalesce(self):
+        queue = _EventQueue(2, 'coalesce')
+        queue.put_event(Event(step=0, summary=scalar('a', 0)))
+        queue.put_event(Event(step=0, summary=scalar('b', 0)))
+        queue.put_event(Event(step=1, summary=scalar('a', 1)))
+        queue.put_event(Event(step=1))
+        assert self.steps(queue) == [1, 0]
+        assert queue.queue[0].summary.value[0].simple_value == 1
+        assert queue.dropped == 2
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            _EventQueue(2, 'drop_everything')
+
+    def test_dropped_events_are_logged(self):
+        queue = _EventQueue(2, 'drop_newest')
+        for step in range(5):
+            queue.put_event(Event(step=step))
+        ev_writer = RecordingEventsWriter()
+        worker = _EventLoggerThread(queue, ev_writer, flush_secs=1000)
+        worker.start()
+        worker.stop()
+        logged = ev_writer.batches[-1][0]
+        assert logged.summary.value[0].tag == DROPPED_EVENTS_TAG
+        assert logged.summary.value[0].simple_value == 3
+        assert logged.step == 1
+
+
+class MultiplexedEventFileWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.logdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.logdir)
+
+    def test_runs_share_a_bounded_set_of_files(self):
+        writer = MultiplexedEventFileWriter(max_open_files=2)
+        runs = [os.path.join(self.logdir, 'run{}'.format(i)) for i in range(5)]
+        for step in range(20):
+            for run in runs:
+                writer.add_event(run, Event(step=step, summary=scalar('loss', step)))
+            writer.flush()
+            assert writer.get_stats()['open_files'] <= 2
+        # Idle files are closed and reopened in append mode.
+        writer._writers.close_idle(time.time() + 1000)
+        assert writer.get_stats()['open_files'] == 0
+        writer.add_event(runs[0], Event(step=20, summary=scalar('loss', 20)))
+        writer.close()
+        assert writer.get_stats()['opens'] > len(runs)
+        for i, run in enumerate(runs):
+            assert len(glob.glob(os.path.join(run, 'events.out.tfevents.*'))) == 1
+            events = read_events(run)
+            assert not events[0].HasField('summary')
+            assert [event.step for event in events[1:]] == list(range(21 if i == 0 else 20))
+
+    def test_rotated_runs_are_reopened(self):
+        writer = MultiplexedEventFileWriter(max_file_bytes=200)
+        run = os.path.join(self.logdir, 'run')
+        for step in range(20):
+            writer.add_event(run, Event(step=step, summary=scalar('loss', step)))
+            writer.flush()
+            writer._writers.close_idle(time.time() + 1000)
+        writer.close()
+        assert len(glob.glob(os.path.join(run, 'events.out.tfevents.*'))) > 2
+        assert [event.step for event in read_events(run) if event.HasField('summary')] == list(range(20))
@@ -23,4 +23,56 @@ class NumpyTest(unittest.TestCase):
         assert isinstance(res, np.ndarray) and res.shape == (1,)
 
     def test_make_grid(self):
-        pass
+        images = np.random.rand(10, 3, 4, 5).astype(np.float32)
+        grid = x2num.make_grid(images, ncols=4)
+        assert grid.shape == (3, 12, 20) and grid.dtype == np.float32
+        for i in range(10):
+            y, x = divmod(i, 4)
+            assert np.array_equal(grid[:, y * 4:(y + 1) * 4, x * 5:(x + 1) * 5], images[i])
+        assert not grid[:, 8:, 10:].any()
+
+    def test_prepare_image_keeps_uint8(self):
+        images = np.random.randint(0, 256, size=(3, 1, 4, 5), dtype=np.uint8)
+        res = x2num.make_np(images, 'IMG')
+        assert res.dtype == np.uint8 and res.shape == (4, 15, 3)
+        for c in range(3):
+            assert np.array_equal(res[:, 5:10, c], images[1, 0])
+
+    def test_prepare_video(self):
+        videos = np.random.randint(0, 256, size=(3, 3, 2, 4, 5), dtype=np.uint8)
+        res = x2num._prepare_video(videos)
+        # padded to 4 videos on a 2x2 grid
+        assert res.shape == (2, 8, 10, 3) and res.dtype == np.uint8
+        assert np.array_equal(res[:, 4:, :5], videos[2].transpose(1, 2, 3, 0))
+        assert not res[:, 4:, 5:].any()
+        res = x2num._prepare_video(videos, (1, None))
+        assert res.shape == (2, 4, 15, 3)
+        assert np.array_equal(res[:, :, 5:10], videos[1].transpose(1, 2, 3, 0))
+        with self.assertRaises(ValueError):
+            x2num._prepare_video(videos, (1, 2))
+
+    def test_make_scalar(self):
+        for value in [1.5, 3, True, np.float32(2.5), np.array(4.0), np.array([[5.0]])]:
+            res = x2num.make_scalar(value)
+            assert isinstance(res, float) and res == float(np.asarray(value).reshape(()))
+        with self.assertRaises(AssertionError):
+            x2num.make_scalar(np.zeros(2))
+
+    def test_register_converter(self):
+        class Tensor(object):
+            def __init__(self, data):
+                self.data = data
+
+        class SubTensor(Tensor):
+            pass
+
+        with self.assertRaises(NotImplementedError):
+            x2num.make_np(Tensor([1.0]))
+        x2num.register_converter(Tensor, lambda x, modality: x2num.prepare_numpy(np.array(x.data), modality))
+        try:
+            assert np.array_equal(x2num.make_np(SubTensor([1.0, 2.0])), [1.0, 2.0])
+            assert x2num.make_scalar(Tensor([3.0])) == 3.0
+            assert x2num.make_np(Tensor(np.zeros((2, 1, 4, 4))), 'IMG').shape == (4, 8, 3)
+        finally:
+            del x2num._converters[Tensor]
+            x2num._dispatch_cache.clear()
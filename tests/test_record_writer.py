@@ -0,0 +1,225 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import tensorboardX
+from tensorboardX import SummaryWriter
+from tensorboardX.record_writer import RecordWriter, S3_MIN_PART_SIZE, S3RecordWriterFactory, masked_crc32c, s3_clients
+try:
+    import boto3
+    from moto import mock_aws
+    moto_installed = True
+except ImportError:
+    print('moto is not installed, skipping S3 tests')
+    moto_installed = False
+try:
+    import fsspec
+    fsspec_installed = True
+except ImportError:
+    print('fsspec is not installed, skipping fsspec tests')
+    fsspec_installed = False
+
+
+def run_script(script, *args):
+    """Runs ``script`` in a new interpreter, free of the test runner's logging
+    setup, and returns what it printed on stdout and stderr."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(tensorboardX.__file__)))
+    return subprocess.check_output([sys.executable, '-c', script] + list(args), env=env,
+                                   stderr=subprocess.STDOUT).decode('utf-8', 'replace')
+
+
+def read_records(path):
+    with open(path, 'rb') as f:
+        return parse_records(f.read())
+
+
+def parse_records(data):
+    records = []
+    offset = 0
+    while offset < len(data):
+        header = data[offset:offset + 8]
+        length, = struct.unpack('<Q', header)
+        header_crc, = struct.unpack('<I', data[offset + 8:offset + 12])
+        assert header_crc == masked_crc32c(header)
+        payload = data[offset + 12:offset + 12 + length]
+        payload_crc, = struct.unpack('<I', data[offset + 12 + length:offset + 16 + length])
+        assert payload_crc == masked_crc32c(payload)
+        records.append(payload)
+        offset += 16 + length
+    return records
+
+
+class RecordWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.logdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.logdir, 'records')
+
+    def tearDown(self):
+        shutil.rmtree(self.logdir)
+
+    def test_roundtrip(self):
+        payloads = [b'', b'a', b'hello world' * 100, os.urandom(5000)]
+        writer = RecordWriter(self.path)
+        for payload in payloads:
+            writer.write(payload)
+        writer.close()
+        assert read_records(self.path) == payloads
+
+    def test_buffered_until_flush(self):
+        writer = RecordWriter(self.path, flush_secs=1000)
+        for i in range(100):
+            writer.write(b'event')
+        assert os.path.getsize(self.path) == 0
+        writer.flush()
+        assert read_records(self.path) == [b'event'] * 100
+        writer.close()
+
+    def test_large_batches_are_written(self):
+        writer = RecordWriter(self.path, flush_secs=1000, max_pending_bytes=1000)
+        for i in range(100):
+            writer.write(b'x' * 100)
+        writer.flush()
+        assert read_records(self.path) == [b'x' * 100] * 100
+        writer.close()
+
+
+if moto_installed:
+    class S3RecordWriterTest(unittest.TestCase):
+        def setUp(self):
+            for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+                os.environ.setdefault(name, 'testing')
+            os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+            self.mock = mock_aws()
+            self.mock.start()
+            s3_clients.clear()
+            self.s3 = boto3.client('s3')
+            self.s3.create_bucket(Bucket='bucket')
+
+        def tearDown(self):
+            self.mock.stop()
+
+        def read_object(self, key):
+            return self.s3.get_object(Bucket='bucket', Key=key)['Body'].read()
+
+        def test_small_file(self):
+            writer = RecordWriter('s3://bucket/run/records')
+            writer.write(b'event')
+            writer.close()
+            assert parse_records(self.read_object('run/records')) == [b'event']
+
+        def test_parts_are_uploaded_once(self):
+            payload = os.urandom(1 << 20)
+            # Every write reaches the S3 writer, without flushing it.
+            writer = RecordWriter('s3://bucket/run/records', flush_secs=1000, max_pending_bytes=1)
+            s3_writer = writer._writer
+            for i in range(12):
+                writer.write(payload)
+                assert len(s3_writer.buffer) < S3_MIN_PART_SIZE
+            assert len(s3_writer._parts) == 2
+            uploads = self.s3.list_multipart_uploads(Bucket='bucket')['Uploads']
+            assert [upload['Key'] for upload in uploads] == ['run/records']
+            writer.close()
+            assert parse_records(self.read_object('run/records')) == [payload] * 12
+            assert 'Uploads' not in self.s3.list_multipart_uploads(Bucket='bucket')
+
+        def test_flush_completes_large_objects(self):
+            payload = os.urandom(2 << 20)
+            writer = RecordWriter('s3://bucket/run/records', flush_secs=1000)
+            for i in range(3):
+                writer.write(payload)
+            writer.flush()
+            assert parse_records(self.read_object('run/records')) == [payload] * 3
+            # Less than flush_bytes: kept for the next object.
+            writer.write(b'event')
+            writer.flush()
+            assert [item['Key'] for item in self.s3.list_objects(Bucket='bucket')['Contents']] == ['run/records']
+            writer.write(b'last')
+            writer.close()
+            assert parse_records(self.read_object('run/records.000001')) == [b'event', b'last']
+            assert len(self.s3.list_objects(Bucket='bucket')['Contents']) == 2
+
+        def test_close_after_flush(self):
+            writer = RecordWriter('s3://bucket/run/records', flush_secs=1000)
+            writer.write(os.urandom(6 << 20))
+            writer.flush()
+            writer.close()
+            assert [item['Key'] for item in self.s3.list_objects(Bucket='bucket')['Contents']] == ['run/records']
+
+        def test_summary_writer(self):
+            with SummaryWriter('s3://bucket/run') as writer:
+                writer.add_scalar('loss', 1.0, 1)
+            key, = [item['Key'] for item in self.s3.list_objects(Bucket='bucket')['Contents']]
+            assert key.startswith('run/events.out.tfevents.')
+            assert len(parse_records(self.read_object(key))) == 2
+
+        def test_writers_share_clients(self):
+            factory = S3RecordWriterFactory(max_pool_connections=4)
+            writers = [factory.open('s3://bucket/run{}/records'.format(i)) for i in range(3)]
+            for writer in writers:
+                writer.write(b'abc')
+                writer.close()
+            other = S3RecordWriterFactory(endpoint_url='https://s3.us-east-1.amazonaws.com').open('s3://bucket/x')
+            other.close()
+            client = s3_clients.get(max_pool_connections=4)
+            assert client.meta.config.max_pool_connections == 4
+            assert s3_clients.get_stats() == {'clients': 2, 'requests': {'put_object': 4}, 'bytes_uploaded': 9}
+
+
+if fsspec_installed:
+    class FsspecRecordWriterTest(unittest.TestCase):
+        def setUp(self):
+            self.fs = fsspec.filesystem('memory')
+            self.logdir = tempfile.mkdtemp()
+
+        def tearDown(self):
+            if self.fs.exists('/run'):
+                self.fs.rm('/run', recursive=True)
+            shutil.rmtree(self.logdir)
+
+        def test_summary_writer_in_script(self):
+            # Remote log dirs must not end up opened as local files, e.g. by a logging handler.
+            run_script(
+                'import fsspec\n'
+                'from tensorboardX import SummaryWriter\n'
+                'with SummaryWriter("memory://run") as writer:\n'
+                '    writer.add_scalar("loss", 1.0, 1)\n'
+                'assert len(fsspec.filesystem("memory").ls("/run")) == 1\n')
+
+        def test_memory(self):
+            writer = RecordWriter('memory://run/records')
+            writer.write(b'a')
+            writer.close()
+            writer = RecordWriter('memory://run/records', append=True)
+            writer.write(b'b')
+            writer.close()
+            assert parse_records(self.fs.cat('/run/records')) == [b'a', b'b']
+
+        def test_file(self):
+            writer = RecordWriter('file://' + self.path('records'))
+            writer.write(b'event')
+            writer.close()
+            assert read_records(self.path('records')) == [b'event']
+
+        def path(self, name):
+            return os.path.join(self.logdir, name)
+
+        def test_summary_writer(self):
+            with SummaryWriter('memory://run') as writer:
+                writer.add_scalar('loss', 1.0, 1)
+            path, = self.fs.ls('/run', detail=False)
+            assert os.path.basename(path).startswith('events.out.tfevents.')
+            assert len(parse_records(self.fs.cat(path))) == 2
+            with SummaryWriter('file://' + self.logdir) as writer:
+                writer.add_scalar('loss', 1.0, 1)
+            name, = os.listdir(self.logdir)
+            assert len(read_records(self.path(name))) == 2
@@ -0,0 +1,104 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from tensorboardX import SummaryWriter
+from tensorboardX.scalar_history import ScalarHistory, dump_json
+
+
+class ScalarHistoryTest(unittest.TestCase):
+    def test_unbounded_keeps_all_rows(self):
+        history = ScalarHistory()
+        for step in range(1000):
+            history.append(100.0 + step, step, step * 0.5)
+        assert len(history) == history.count == 1000
+        timestamps, steps, values = history.columns()
+        np.testing.assert_array_equal(steps, np.arange(1000))
+        np.testing.assert_array_equal(values, np.arange(1000) * 0.5)
+        np.testing.assert_array_equal(timestamps, 100.0 + np.arange(1000))
+
+    def test_ring_keeps_latest_rows(self):
+        history = ScalarHistory(capacity=10)
+        for step in range(25):
+            history.append(step, step, step)
+        assert len(history) == 10 and history.count == 25
+        np.testing.assert_array_equal(history.columns()[1], np.arange(15, 25))
+
+    def test_reservoir_samples_whole_run(self):
+        history = ScalarHistory(capacity=100, mode='reservoir', seed=0)
+        for step in range(10000):
+            history.append(step, step, step)
+        steps = history.columns()[1]
+        assert len(steps) == 100
+        assert (np.diff(steps) > 0).all()
+        assert steps[0] < 2000 and steps[-1] > 8000
+
+    def test_missing_step(self):
+        history = ScalarHistory()
+        history.append(1.0, None, 2.0)
+        assert history.rows() == [[1.0, None, 2.0]]
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            ScalarHistory(mode='random')
+        with self.assertRaises(ValueError):
+            ScalarHistory(capacity=0)
+
+    def test_dump_json_matches_lists(self):
+        histories = {'a': ScalarHistory(), 'b': ScalarHistory(), 'empty': ScalarHistory()}
+        expected = {'a': [], 'b': [], 'empty': []}
+        for step in range(50):
+            for tag in ('a', 'b'):
+                histories[tag].append(1.5 * step, step, step * 0.25)
+                expected[tag].append([1.5 * step, step, step * 0.25])
+        f = io.StringIO()
+        dump_json(histories, f, chunk_rows=7)
+        assert json.loads(f.getvalue()) == expected
+
+    def test_columns_are_compact(self):
+        history = ScalarHistory()
+        for step in range(1 << 14):
+            history.append(step, step, step)
+        nbytes = sum(column.nbytes for column in (history._timestamps, history._steps, history._values))
+        assert nbytes == 20 << 14
+
+
+class WriterScalarHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.logdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.logdir)
+
+    def test_export_scalars_to_json(self):
+        writer = SummaryWriter(self.logdir, scalar_history_capacity=3)
+        for step in range(5):
+            writer.add_scalars('loss', {'train': step, 'test': 2 * step}, step)
+        path = os.path.join(self.logdir, 'scalars.json')
+        writer.export_scalars_to_json(path)
+        writer.close()
+        with open(path) as f:
+            exported = json.load(f)
+        assert sorted(exported) == sorted(writer.log_dir + '/loss/' + run for run in ('train', 'test'))
+        for tag, rows in exported.items():
+            scale = 2 if tag.endswith('test') else 1
+            assert [row[1:] for row in rows] == [[step, scale * step] for step in (2, 3, 4)]
+        assert writer.scalar_dict == {}
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            SummaryWriter(self.logdir, scalar_history_mode='newest')
+
+
+if __name__ == '__main__':
+    unittest.main()
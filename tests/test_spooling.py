@@ -0,0 +1,154 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tensorboardX import SummaryWriter
+from tensorboardX.record_writer import REGISTERED_FACTORIES, RecordWriter, register_writer_factory
+from tensorboardX.spooling import SpoolingWriterFactory, enable_spooling
+from tests.test_record_writer import parse_records, run_script
+
+
+class FakeWriter(object):
+    def __init__(self, factory, path):
+        self.factory = factory
+        self.path = path
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.factory.failures:
+            self.factory.failures -= 1
+            raise IOError('network is down')
+        self.factory.files[self.path] = self.data
+        self.factory.uploads.append(self.path)
+
+
+class FakeWriterFactory(object):
+    """A remote file system which fails its ``failures`` next uploads."""
+
+    def __init__(self, failures=0):
+        self.files = {}
+        self.uploads = []
+        self.failures = failures
+
+    def open(self, path):
+        return FakeWriter(self, path)
+
+    def directory_check(self, path):
+        pass
+
+
+class SpoolingTest(unittest.TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        REGISTERED_FACTORIES.pop('fake', None)
+        shutil.rmtree(self.spool_dir)
+
+    def test_segments(self):
+        remote = FakeWriterFactory()
+        spooling = SpoolingWriterFactory(remote, self.spool_dir, segment_bytes=100)
+        register_writer_factory('fake', spooling)
+        writer = RecordWriter('fake://run/events', flush_secs=0)
+        for i in range(40):
+            writer.write(str(i).encode() * 30)
+        writer.close()
+        assert spooling.wait(10)
+        # TensorBoard reads the segments in the order of their names.
+        names = sorted(remote.files)
+        assert names == remote.uploads
+        assert len(names) > 11
+        assert names == ['fake://run/events'] + ['fake://run/events.{:06d}'.format(i) for i in range(1, len(names))]
+        records = []
+        for path in names:
+            records += parse_records(remote.files[path])
+        assert records == [str(i).encode() * 30 for i in range(40)]
+        assert spooling.get_stats() == {'uploaded': len(names), 'retries': 0, 'failed': 0, 'pending': 0}
+        assert os.listdir(self.spool_dir) == ['manifest.{}.json'.format(os.getpid())]
+
+    def test_retries(self):
+        remote = FakeWriterFactory(failures=2)
+        spooling = SpoolingWriterFactory(remote, self.spool_dir, backoff_secs=0.01)
+        writer = spooling.open('fake://run/events')
+        writer.write(b'abc')
+        writer.close()
+        assert spooling.wait(10)
+        assert remote.files == {'fake://run/events': b'abc'}
+        assert spooling.get_stats()['retries'] == 2
+
+    def test_resume_after_crash(self):
+        script = (
+            'import os, sys\n'
+            'from tensorboardX.record_writer import RecordWriter, register_writer_factory\n'
+            'from tensorboardX.spooling import SpoolingWriterFactory\n'
+            'from tests.test_spooling import FakeWriterFactory\n'
+            'spooling = SpoolingWriterFactory(FakeWriterFactory(failures=1), sys.argv[1], retries=0)\n'
+            'failed = spooling.open("fake://run/failed")\n'
+            'failed.write(b"abc")\n'
+            'failed.close()\n'
+            'spooling.wait()\n'
+            'register_writer_factory("fake", spooling)\n'
+            'crashed = RecordWriter("fake://run/crashed", flush_secs=0)\n'
+            'crashed.write(b"event")\n'
+            'crashed._writer._file.write(b"\\x05\\x00")\n'
+            'crashed._writer._file.flush()\n'
+            'os._exit(0)\n')
+        # The process dies while writing a record.
+        run_script(script, self.spool_dir)
+
+        remote = FakeWriterFactory()
+        spooling = SpoolingWriterFactory(remote, self.spool_dir)
+        assert spooling.wait(10)
+        assert remote.files['fake://run/failed'] == b'abc'
+        assert parse_records(remote.files['fake://run/crashed']) == [b'event']
+        assert spooling.get_stats()['pending'] == 0
+        assert os.listdir(self.spool_dir) == ['manifest.{}.json'.format(os.getpid())]
+
+    def test_segments_of_running_processes_are_not_resumed(self):
+        # The parent of the test process is still running.
+        manifest = os.path.join(self.spool_dir, 'manifest.{}.json'.format(os.getppid()))
+        with open(manifest, 'w') as f:
+            json.dump({'segment': {'remote': 'fake://run/events', 'complete': False}}, f)
+        with open(os.path.join(self.spool_dir, 'segment'), 'wb') as f:
+            f.write(b'\x05\x00')
+        remote = FakeWriterFactory()
+        spooling = SpoolingWriterFactory(remote, self.spool_dir)
+        assert spooling.wait(10)
+        assert remote.files == {}
+        assert os.path.getsize(os.path.join(self.spool_dir, 'segment')) == 2
+        assert os.path.exists(manifest)
+
+    def test_one_factory_per_directory(self):
+        spooling = SpoolingWriterFactory(FakeWriterFactory(), self.spool_dir)
+        with self.assertRaises(ValueError):
+            SpoolingWriterFactory(FakeWriterFactory(), self.spool_dir)
+
+    def test_summary_writer(self):
+        remote = FakeWriterFactory()
+        register_writer_factory('fake', remote)
+        spooling = enable_spooling('fake', os.path.join(self.spool_dir, 'spool'))
+        assert REGISTERED_FACTORIES['fake'] is spooling
+        assert enable_spooling('fake') is spooling
+        with SummaryWriter('fake://run') as writer:
+            writer.add_scalar('loss', 1.0, 1)
+        assert spooling.wait(10)
+        path, = remote.files
+        assert path.startswith('fake://run/events.out.tfevents.')
+        assert len(parse_records(remote.files[path])) == 2
+
+
+if __name__ == '__main__':
+    unittest.main()
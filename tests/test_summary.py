@@ -1,7 +1,11 @@
 from tensorboardX import summary
 
+import io
+import logging
 import numpy as np
+import pickle
 import pytest
+import struct
 import unittest
 
 
@@ -23,6 +27,13 @@ class SummaryTest(unittest.TestCase):
         scale_factor = summary._calc_scale_factor(test_image)
         assert scale_factor == 255, 'Values are in [0, 1], scale factor should be 255'
 
+    def test_uint8_image_pixels(self):
+        from PIL import Image
+        test_image = np.random.randint(0, 256, size=(3, 8, 8), dtype=np.uint8)
+        image = summary.image('i', test_image).value[0].image
+        decoded = np.asarray(Image.open(io.BytesIO(image.encoded_image_string)))
+        assert np.array_equal(decoded, test_image.transpose(1, 2, 0))
+
     def test_list_input(self):
         with pytest.raises(Exception) as e_info:
             summary.histogram('dummy', [1,3,4,5,6], 'tensorflow')
@@ -31,3 +42,131 @@ class SummaryTest(unittest.TestCase):
         print('expect error here:')
         with pytest.raises(Exception) as e_info:
             summary.histogram('dummy', np.ndarray(0), 'tensorflow')
+
+    def test_histogram_matches_numpy(self):
+        values = np.random.randn(200000).astype(np.float32)
+        ref = values.astype(np.float64)
+        for bins in [30, np.linspace(-2, 2, 11)]:
+            hist = summary.make_histogram(values, bins)
+            counts, limits = np.histogram(ref, bins=bins)
+            nz = np.flatnonzero(counts)
+            start, end = max(0, nz[0] - 1), nz[-1] + 1
+            assert list(hist.bucket) == counts[start:end].tolist()
+            np.testing.assert_allclose(hist.bucket_limit, limits[1:][start:end])
+            assert hist.num == values.size
+            assert hist.min == ref.min() and hist.max == ref.max()
+            np.testing.assert_allclose(hist.sum, ref.sum())
+            np.testing.assert_allclose(hist.sum_squares, ref.dot(ref))
+
+    def test_histogram_tensorflow_bins(self):
+        edges = summary.default_bins()
+        values = np.concatenate([np.random.randn(100000) * 100, edges, [0.0, -1e21, 1e21, np.nan]])
+        hist = summary.make_histogram(values, 'tensorflow')
+        counts, limits = np.histogram(values[~np.isnan(values)], bins=np.array(edges))
+        nz = np.flatnonzero(counts)
+        start, end = max(0, nz[0] - 1), nz[-1] + 1
+        assert list(hist.bucket) == counts[start:end].tolist()
+        assert list(hist.bucket_limit) == limits[1:][start:end].tolist()
+        assert list(summary.make_histogram(values, edges.tolist()).bucket) == list(hist.bucket)
+
+    def test_audio_mono(self):
+        clip = np.random.uniform(-1, 1, (1, 1000)).astype(np.float32)
+        audio = summary.audio('a', clip).value[0].audio
+        expected = b''.join(struct.pack('<h', int(32767.0 * x)) for x in clip[0])
+        assert audio.encoded_audio_string[44:] == expected
+        assert audio.num_channels == 1 and audio.length_frames == 1000
+
+    def test_audio_channels_and_batch(self):
+        clip = np.array([[0.5, -0.5, 1.0], [0.25, 0.0, -1.0]])
+        audio = summary.audio('a', clip).value[0].audio
+        assert audio.num_channels == 2 and audio.length_frames == 3
+        assert audio.encoded_audio_string[44:] == struct.pack('<6h', 16383, 8191, -16383, 0, 32767, -32767)
+        values = summary.audio('a', np.zeros((3, 2, 10))).value
+        assert [v.tag for v in values] == ['a/audio/0', 'a/audio/1', 'a/audio/2']
+        assert all(v.audio.num_channels == 2 for v in values)
+
+    def test_video_gif(self):
+        from PIL import Image
+        for shared_palette in [False, True]:
+            video = np.random.randint(0, 256, size=(1, 3, 5, 16, 24), dtype=np.uint8)
+            image = summary.video('v', video, fps=10, shared_palette=shared_palette).value[0].image
+            assert (image.height, image.width, image.colorspace) == (16, 24, 3)
+            gif = Image.open(io.BytesIO(image.encoded_image_string))
+            assert gif.format == 'GIF' and gif.n_frames == 5
+            assert gif.info['duration'] == 100
+
+
+class HistogramAccumulatorTest(unittest.TestCase):
+    def test_update_matches_make_histogram(self):
+        chunks = [np.random.randn(n).astype(np.float32) for n in [10, 70000, 3]]
+        for bins in ['tensorflow', np.linspace(-2, 2, 9)]:
+            acc = summary.HistogramAccumulator(bins)
+            for chunk in chunks:
+                acc.update(chunk)
+            expected = summary.make_histogram(np.concatenate(chunks), bins)
+            hist = acc.to_proto()
+            assert list(hist.bucket) == list(expected.bucket)
+            assert list(hist.bucket_limit) == list(expected.bucket_limit)
+            assert hist.num == expected.num and hist.min == expected.min and hist.max == expected.max
+            np.testing.assert_allclose([hist.sum, hist.sum_squares], [expected.sum, expected.sum_squares])
+
+    def test_merge_after_pickle(self):
+        a = summary.HistogramAccumulator().update(np.arange(10.0))
+        b = pickle.loads(pickle.dumps(summary.HistogramAccumulator().update(np.arange(-5.0, 0.0))))
+        assert b.edges is summary.default_bins()
+        hist = a.merge(b).to_proto()
+        expected = summary.make_histogram(np.arange(-5.0, 10.0), 'tensorflow')
+        assert hist == expected
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            summary.HistogramAccumulator(10)
+        with pytest.raises(ValueError):
+            summary.HistogramAccumulator('auto')
+        with pytest.raises(ValueError):
+            summary.HistogramAccumulator().to_proto()
+        with pytest.raises(ValueError):
+            summary.HistogramAccumulator([0, 1]).merge(summary.HistogramAccumulator([0, 2]))
+
+    def test_histogram_summary(self):
+        acc = summary.HistogramAccumulator().update(np.ones(4))
+        value = summary.histogram('h', acc, 'auto').value[0]
+        assert value.tag == 'h'
+        assert value.histo.num == 4
+
+
+class TagCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.saved_cache = summary._tag_cache
+        summary._tag_cache = summary._TagCache(4)
+
+    def tearDown(self):
+        summary._tag_cache = self.saved_cache
+
+    def test_hits_and_eviction(self):
+        for _ in range(3):
+            assert summary.scalar('loss', 1.0).value[0].tag == 'loss'
+        stats = summary.tag_cache_stats()
+        assert (stats['hits'], stats['misses'], stats['size']) == (2, 1, 1)
+        assert abs(stats['hit_rate'] - 2.0 / 3) < 1e-9
+        for i in range(10):
+            summary.scalar('tag{}'.format(i), 1.0)
+        assert summary.tag_cache_stats()['size'] == 4
+        summary.scalar('loss', 1.0)
+        assert summary.tag_cache_stats()['misses'] == 12
+
+    def test_warning_logged_once(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger()
+        level = logger.level
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        try:
+            for _ in range(3):
+                assert summary.text('/bad tag', 'x').value[0].tag == 'bad_tag/text_summary'
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+        assert len([r for r in records if 'is illegal' in r.getMessage()]) == 1
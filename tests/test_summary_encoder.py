@@ -0,0 +1,128 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from tensorboardX import SummaryWriter, summary_encoder
+from tests.test_event_file_writer import read_events
+from tests.test_record_writer import run_script
+
+
+class DeferredEncodingTest(unittest.TestCase):
+    def setUp(self):
+        self.logdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.logdir)
+
+    def write_and_read(self, backend):
+        values = np.zeros(100)
+        with SummaryWriter(self.logdir, deferred_encoding=backend, encoding_workers=4) as writer:
+            for step in range(20):
+                values[:] = step
+                writer.add_histogram('histogram', values, step)
+                writer.add_image('image', np.random.rand(3, 8, 8), step)
+                writer.add_audio('audio', np.random.rand(1000) * 2 - 1, step)
+        return [event for event in read_events(self.logdir) if event.HasField('summary')]
+
+    def check_events(self, events):
+        histograms = [event for event in events if event.summary.value[0].tag == 'histogram']
+        images = [event for event in events if event.summary.value[0].tag == 'image']
+        audios = [event for event in events if event.summary.value[0].tag == 'audio']
+        assert [event.step for event in histograms] == list(range(20))
+        assert [event.step for event in images] == list(range(20))
+        assert [event.step for event in audios] == list(range(20))
+        # The values were snapshotted when add_histogram was called.
+        for event in histograms:
+            assert event.summary.value[0].histo.max == event.step
+        assert [event.step for event in events] == sorted(event.step for event in events)
+
+    def test_thread_backend(self):
+        self.check_events(self.write_and_read('thread'))
+
+    def test_process_backend(self):
+        self.check_events(self.write_and_read('process'))
+
+    def test_process_backend_uses_shared_memory(self):
+        if summary_encoder.shared_memory is None:
+            return
+        with SummaryWriter(self.logdir, deferred_encoding='process', encoding_workers=1) as writer:
+            assert writer._encoder.backend == 'process'
+            writer.add_image('image', np.zeros((3, 8, 8), dtype=np.uint8), 0)
+            writer.add_histogram('empty', np.zeros(0), 0)
+
+    def test_process_backend_releases_shared_memory_quietly(self):
+        script = (
+            'import sys\n'
+            'import numpy as np\n'
+            'from tensorboardX import SummaryWriter\n'
+            'if __name__ == "__main__":\n'
+            '    with SummaryWriter(sys.argv[1], deferred_encoding="process", encoding_workers=2) as writer:\n'
+            '        for step in range(5):\n'
+            '            writer.add_image("image", np.zeros((3, 8, 8), dtype=np.uint8), step)\n')
+        output = run_script(script, self.logdir)
+        # Neither a block unregistered twice nor a leaked one is reported.
+        assert 'Traceback' not in output and 'leaked' not in output, output
+
+    def test_process_backend_does_not_fork(self):
+        with SummaryWriter(self.logdir, deferred_encoding='process', encoding_workers=1) as writer:
+            if writer._encoder.backend == 'process':
+                assert writer._encoder._pool._ctx.get_start_method() in ('forkserver', 'spawn')
+
+    def test_default_bins_are_passed_by_name(self):
+        with SummaryWriter(self.logdir, deferred_encoding='thread', encoding_workers=1) as writer:
+            submitted = []
+            submit = writer._encoder.submit
+            writer._encoder.submit = lambda fn, tag, tensor, kwargs, *args: submitted.append(kwargs) or submit(
+                fn, tag, tensor, kwargs, *args)
+            writer.add_histogram('histogram', np.arange(10), 0)
+        # The edges would not be recognized as the default ones once pickled.
+        assert submitted == [{'bins': 'tensorflow'}]
+        histo = [event for event in read_events(self.logdir) if event.HasField('summary')][0].summary.value[0].histo
+        assert histo.num == 10 and histo.max == 9
+
+    def test_process_backend_falls_back_to_threads(self):
+        shared_memory = summary_encoder.shared_memory
+        summary_encoder.shared_memory = None
+        try:
+            with SummaryWriter(self.logdir, deferred_encoding='process') as writer:
+                assert writer._encoder.backend == 'thread'
+                writer.add_image('image', np.zeros((3, 8, 8)), 0)
+        finally:
+            summary_encoder.shared_memory = shared_memory
+        events = [event for event in read_events(self.logdir) if event.HasField('summary')]
+        assert len(events) == 1
+
+    def test_failed_encoding_is_logged_apart_from_events(self):
+        with SummaryWriter(self.logdir, deferred_encoding='thread', encoding_workers=1) as writer:
+            with self.assertLogs('tensorboardX.summary_encoder', 'ERROR'):
+                writer.add_histogram('empty', np.zeros(0), 0)
+                writer.add_scalar('scalar', 1.0, 1)
+                writer.flush()
+        events = [event for event in read_events(self.logdir) if event.HasField('summary')]
+        assert [event.summary.value[0].tag for event in events] == ['scalar']
+
+    def test_summaries_are_written_at_exit_without_close(self):
+        script = (
+            'import sys\n'
+            'import numpy as np\n'
+            'from tensorboardX import SummaryWriter\n'
+            'if __name__ == "__main__":\n'
+            '    writer = SummaryWriter(sys.argv[1], deferred_encoding=sys.argv[2])\n'
+            '    for step in range(10):\n'
+            '        writer.add_histogram("histogram", np.random.rand(1000), step)\n')
+        for backend in ('thread', 'process'):
+            logdir = tempfile.mkdtemp(dir=self.logdir)
+            run_script(script, logdir, backend)
+            events = [event for event in read_events(logdir) if event.HasField('summary')]
+            assert [event.step for event in events] == list(range(10))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            SummaryWriter(self.logdir, deferred_encoding='gpu')
@@ -1,4 +1,12 @@
-from tensorboardX import SummaryWriter
+from tensorboardX import SummaryWriter, HistogramAccumulator
+from tensorboardX.summary import default_bins, make_histogram
+import numpy as np
+import os
+import shutil
+import tempfile
+import threading
+
+from tests.test_event_file_writer import read_events
 import unittest
 
 
@@ -21,3 +29,93 @@ class SummaryWriterTest(unittest.TestCase):
             passed = False
 
         assert passed
+
+    def test_add_histogram_accumulator(self):
+        chunks = [np.random.randn(100) for _ in range(3)]
+        values = np.concatenate(chunks)
+        acc = HistogramAccumulator()
+        for chunk in chunks[:2]:
+            acc.update(chunk)
+        acc.merge(HistogramAccumulator().update(chunks[2]))
+        merged = acc.to_proto()
+        assert merged.num == 300
+        self.assertAlmostEqual(merged.sum, values.sum())
+        logdir = tempfile.mkdtemp()
+        try:
+            with SummaryWriter(logdir, deferred_encoding='thread') as writer:
+                acc.emit(writer, 'hist', 1)
+                writer.add_histogram('hist', values, 2)
+            histograms = [event.summary.value[0].histo for event in read_events(logdir) if event.HasField('summary')]
+        finally:
+            shutil.rmtree(logdir)
+        expected = make_histogram(values, default_bins())
+        assert len(histograms) == 2
+        for histo in histograms:
+            assert (histo.num, histo.min, histo.max) == (expected.num, expected.min, expected.max)
+            self.assertAlmostEqual(histo.sum, expected.sum)
+            self.assertAlmostEqual(histo.sum_squares, expected.sum_squares)
+            assert list(histo.bucket_limit) == list(expected.bucket_limit)
+            assert list(histo.bucket) == list(expected.bucket)
+
+    def test_add_scalars_batch(self):
+        logdir = tempfile.mkdtemp()
+        try:
+            with SummaryWriter(logdir) as writer:
+                writer.add_scalars_batch({'loss': 0.5, 'acc': np.float32(0.25), ' bad tag': 1}, 3)
+                writer.add_scalars_batch((['a', 'b'], np.array([1.0, 2.0])), 4, walltime=10.0)
+            events = [event for event in read_events(logdir) if event.HasField('summary')]
+            assert [event.step for event in events] == [3, 4]
+            assert [(v.tag, v.simple_value) for v in events[0].summary.value] == [
+                ('loss', 0.5), ('acc', 0.25), ('_bad_tag', 1.0)]
+            assert [(v.tag, v.simple_value) for v in events[1].summary.value] == [('a', 1.0), ('b', 2.0)]
+            assert events[1].wall_time == 10.0
+        finally:
+            shutil.rmtree(logdir)
+
+    def test_add_scalars_shares_one_thread(self):
+        logdir = tempfile.mkdtemp()
+        try:
+            with SummaryWriter(logdir) as writer:
+                threads = threading.active_count()
+                for step in range(3):
+                    writer.add_scalars('metrics', {'class{}'.format(i): i * step for i in range(50)}, step)
+                assert threading.active_count() <= threads + 1
+            for i in range(50):
+                events = read_events(os.path.join(logdir, 'metrics', 'class{}'.format(i)))
+                assert [event.summary.value[0].simple_value for event in events[1:]] == [0, i, 2 * i]
+        finally:
+            shutil.rmtree(logdir)
+
+    def test_event_file_rotation(self):
+        logdir = tempfile.mkdtemp()
+        try:
+            with SummaryWriter(logdir, max_queue=1, max_file_bytes=200) as writer:
+                for step in range(10):
+                    writer.add_scalar('loss', step, step)
+                    writer.add_scalars('metrics', {'a': step}, step)
+            for run in (logdir, os.path.join(logdir, 'metrics', 'a')):
+                assert len([name for name in os.listdir(run) if name.startswith('events.out.tfevents.')]) > 2
+                events = [event for event in read_events(run) if event.HasField('summary')]
+                assert [event.step for event in events] == list(range(10))
+        finally:
+            shutil.rmtree(logdir)
+
+    def test_add_scalars_uses_overflow_policy(self):
+        logdir = tempfile.mkdtemp()
+        try:
+            writer = SummaryWriter(logdir, max_queue=1, overflow_policy='drop_newest', filename_suffix='.x')
+            writer.add_scalars('metrics', {'a': 0}, 0)
+            writer.flush()
+            # Stall the logger thread of the sub-runs.
+            with writer._sub_runs._writers._lock:
+                thread = threading.Thread(
+                    target=lambda: [writer.add_scalars('metrics', {'a': step}, step) for step in range(1, 100)])
+                thread.start()
+                thread.join(10)
+                assert not thread.is_alive()
+            writer.close()
+            assert writer._sub_runs.get_stats()['dropped'] > 0
+            name, = os.listdir(os.path.join(logdir, 'metrics', 'a'))
+            assert name.endswith('.x')
+        finally:
+            shutil.rmtree(logdir)